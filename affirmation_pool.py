@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AffirmationPool:
+    """Bounded buffer of pre-generated affirmations.
+
+    Endpoints ``pop`` from the pool and only fall back to live generation
+    when it is empty. ``refill`` is run in the background by the scheduler
+    and tops the pool back up to capacity once it drops below the low-water
+    mark. ``generate(n)`` returns up to ``n`` affirmations, so a refill costs
+    one upstream call per ``batch_size`` affirmations rather than one each.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[int], List[str]],
+        capacity: Optional[int] = None,
+        low_water: Optional[int] = None,
+        batch_size: Optional[int] = None,
+    ):
+        self._generate = generate
+        self.capacity = capacity or int(os.getenv("POOL_CAPACITY", "20"))
+        self.low_water = low_water or int(os.getenv("POOL_LOW_WATER", "5"))
+        self.batch_size = batch_size or int(os.getenv("POOL_BATCH_SIZE", "10"))
+        self.on_low_water: Optional[Callable[[], None]] = None
+
+        self._items = deque(maxlen=self.capacity)
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._generated_at = deque(maxlen=1000)
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+
+    def depth(self) -> int:
+        """Number of affirmations currently buffered."""
+        with self._lock:
+            return len(self._items)
+
+    def pop(self) -> Optional[str]:
+        """Take a pre-generated affirmation, or ``None`` if the pool is empty."""
+        with self._lock:
+            if self._items:
+                affirmation = self._items.popleft()
+                self.hits += 1
+            else:
+                affirmation = None
+                self.misses += 1
+            depth = len(self._items)
+
+        if (
+            depth < self.low_water
+            and self.on_low_water
+            and not self._refill_lock.locked()
+        ):
+            try:
+                self.on_low_water()
+            except Exception as e:
+                logger.error(f"Failed to trigger pool refill: {str(e)}")
+
+        return affirmation
+
+    def refill(self):
+        """Fill the pool to capacity if it is below the low-water mark."""
+        if not self._refill_lock.acquire(blocking=False):
+            return
+
+        try:
+            if self.depth() >= self.low_water:
+                return
+
+            while self.depth() < self.capacity:
+                missing = self.capacity - self.depth()
+                try:
+                    affirmations = self._generate(min(missing, self.batch_size))
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"Failed to refill affirmation pool: {str(e)}")
+                    break
+
+                with self._lock:
+                    for affirmation in affirmations[:missing]:
+                        self._items.append(affirmation)
+                        self.generated += 1
+                        self._generated_at.append(time.monotonic())
+
+            logger.info(f"Affirmation pool refilled to {self.depth()}/{self.capacity}")
+        finally:
+            self._refill_lock.release()
+
+    def refill_rate(self, window: float = 60.0) -> float:
+        """Affirmations generated per minute over the last ``window`` seconds."""
+        cutoff = time.monotonic() - window
+        with self._lock:
+            recent = sum(1 for t in self._generated_at if t >= cutoff)
+        return recent * 60.0 / window
+
+    def stats(self) -> dict:
+        """Pool depth, refill rate and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "depth": self.depth(),
+            "capacity": self.capacity,
+            "low_water": self.low_water,
+            "batch_size": self.batch_size,
+            "refill_rate_per_min": round(self.refill_rate(), 2),
+            "generated": self.generated,
+            "failures": self.failures,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
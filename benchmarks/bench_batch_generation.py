@@ -0,0 +1,72 @@
+"""Upstream calls and tokens for one affirmation per completion vs. batched.
+
+Generates the same number of affirmations against a local OpenAI stub, once
+with a completion per affirmation and once with ``--batch`` per completion:
+
+    python -m benchmarks.bench_batch_generation --affirmations 200 --batch 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubCompletionServer  # noqa: E402
+
+
+async def measure(label: str, count: int, batch: int, delay: float) -> dict:
+    from generator import AffirmationGenerator
+    from prompts import AFFIRMATION_MESSAGES
+
+    generator = AffirmationGenerator()
+    start = time.perf_counter()
+    generated = 0
+    while generated < count:
+        if batch == 1:
+            await generator.generate(AFFIRMATION_MESSAGES)
+            generated += 1
+        else:
+            affirmations = await generator.generate_batch(
+                AFFIRMATION_MESSAGES, min(batch, count - generated)
+            )
+            generated += len(affirmations)
+    elapsed = time.perf_counter() - start
+    await generator.close()
+
+    usage = generator.usage.stats()
+    return {
+        "mode": label,
+        "affirmations": generated,
+        "upstream_calls": usage["calls"],
+        "prompt_tokens": usage["prompt_tokens"],
+        "prompt_tokens_per_affirmation": usage["prompt_tokens_per_affirmation"],
+        "tokens_per_affirmation": usage["tokens_per_affirmation"],
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--affirmations", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.01, help="Stub completion latency")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with StubCompletionServer(delay=args.delay) as stub:
+        os.environ["OPENAI_API_KEY"] = "sk-stub"
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        results = [
+            asyncio.run(measure("single", args.affirmations, 1, args.delay)),
+            asyncio.run(measure("batched", args.affirmations, args.batch, args.delay)),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
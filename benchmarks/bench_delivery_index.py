@@ -0,0 +1,70 @@
+"""Micro-benchmark of the per-timezone delivery bucket index.
+
+Indexes many recipients at random delivery times, then moves each one, and
+reports how many scheduler jobs the buckets need compared to one per recipient:
+
+    python -m benchmarks.bench_delivery_index --recipients 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery_index import DeliveryIndex  # noqa: E402
+
+TIMEZONES = [
+    "America/Los_Angeles",
+    "America/New_York",
+    "Europe/London",
+    "Europe/Berlin",
+    "Africa/Harare",
+    "Asia/Kolkata",
+    "Asia/Tokyo",
+    "Australia/Sydney",
+]
+
+
+def random_slot(rng: random.Random):
+    # Most people pick a round time in the morning
+    return rng.randint(5, 9), rng.choice([0, 15, 30, 45]), rng.choice(TIMEZONES)
+
+
+def measure(label: str, index: DeliveryIndex, slots) -> dict:
+    jobs_changed = 0
+    start = time.perf_counter()
+    for i, (hour, minute, timezone) in enumerate(slots):
+        opened, closed = index.set(f"user{i}@example.com", hour, minute, timezone)
+        jobs_changed += (opened is not None) + (closed is not None)
+    elapsed = time.perf_counter() - start
+    return {
+        "phase": label,
+        "operations": len(slots),
+        "elapsed_s": round(elapsed, 3),
+        "operations_per_s": round(len(slots) / elapsed, 1),
+        "job_changes": jobs_changed,
+        "buckets": len(index.buckets()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = DeliveryIndex()
+    results = [
+        measure("add", index, [random_slot(rng) for _ in range(args.recipients)]),
+        measure("move", index, [random_slot(rng) for _ in range(args.recipients)]),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
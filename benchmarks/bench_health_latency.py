@@ -0,0 +1,158 @@
+"""Measure /health latency while concurrent /get-affirmation calls are in flight.
+
+Runs the API in-process against a stub completion server, so no OpenAI key
+or network access is needed. Databases and the event log live in a
+temporary directory.
+
+By default the affirmation pool is disabled and concurrent calls are not
+coalesced, so every /get-affirmation is its own upstream generation. With
+``--cached`` both stay on, measuring the path production requests take
+(mostly pool hits and one shared flight):
+
+    python -m benchmarks.bench_health_latency --concurrency 50 --delay 2
+    python -m benchmarks.bench_health_latency --concurrency 50 --delay 2 --cached
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubCompletionServer  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+class Uncoalesced:
+    """Stands in for the SingleFlight so each caller generates on its own."""
+
+    async def do(self, key, fn):
+        return await fn()
+
+    def stats(self) -> dict:
+        return {"coalescing": False}
+
+
+async def probe_health(client, stop: asyncio.Event, interval: float):
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def run(base_url: str, concurrency: int, duration: float, interval: float, cached: bool):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        # Idle baseline
+        stop = asyncio.Event()
+        idle = asyncio.create_task(probe_health(client, stop, interval))
+        await asyncio.sleep(duration)
+        stop.set()
+        idle_samples = await idle
+
+        # Under load
+        stop = asyncio.Event()
+        loaded = asyncio.create_task(probe_health(client, stop, interval))
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(client.get("/get-affirmation") for _ in range(concurrency))
+        )
+        load_elapsed = time.perf_counter() - start
+        stop.set()
+        loaded_samples = await loaded
+
+    return {
+        "concurrency": concurrency,
+        "cached": cached,
+        "affirmation_ok": sum(1 for r in results if r.status_code == 200),
+        "affirmation_wall_s": round(load_elapsed, 3),
+        "health_idle": summarize(idle_samples),
+        "health_under_load": summarize(loaded_samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=1.0, help="stub completion delay (s)")
+    parser.add_argument("--duration", type=float, default=2.0, help="idle baseline window (s)")
+    parser.add_argument("--interval", type=float, default=0.01, help="health probe interval (s)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--cached", action="store_true", help="keep the affirmation pool and call coalescing"
+    )
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with StubCompletionServer(delay=args.delay) as stub, tempfile.TemporaryDirectory() as tmp:
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        os.environ["OPENAI_API_KEY"] = "stub"
+        for var in ("SENDER_EMAIL", "SENDER_PASSWORD", "RECIPIENT_EMAIL"):
+            os.environ.pop(var, None)
+        for var in ("HISTORY_DB", "OUTBOX_DB", "IDEMPOTENCY_DB", "LEADER_DB"):
+            os.environ[var] = os.path.join(tmp, var.lower().replace("_db", ".db"))
+        os.environ["EVENT_LOG_DIR"] = os.path.join(tmp, "event_log")
+        if not args.cached:
+            os.environ["POOL_CAPACITY"] = "0"
+            os.environ["POOL_LOW_WATER"] = "0"
+
+        import uvicorn
+        from main import app, services
+
+        if not args.cached:
+            # Installed before anything builds the real flight
+            services._instances["affirmation_flight"] = Uncoalesced()
+
+        server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning")
+        )
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        try:
+            report = asyncio.run(
+                run(
+                    f"http://127.0.0.1:{args.port}",
+                    args.concurrency,
+                    args.duration,
+                    args.interval,
+                    args.cached,
+                )
+            )
+        finally:
+            server.should_exit = True
+            thread.join()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Micro-benchmark of affirmation email rendering.
+
+Compares building and serializing a full message per recipient with
+encoding once per run and only prepending the To header:
+
+    python -m benchmarks.bench_render --messages 5000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_service import EmailService  # noqa: E402
+
+AFFIRMATION = "You turn ordinary mornings into something worth waking for."
+
+
+def measure(label: str, count: int, render) -> dict:
+    start = time.perf_counter()
+    for i in range(count):
+        render(f"user{i}@example.com")
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": label,
+        "messages": count,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(count / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger("email_service").setLevel(logging.ERROR)
+
+    os.environ.setdefault("SENDER_EMAIL", "sender@example.com")
+    service = EmailService()
+    encoded = service.encode_affirmation_email(AFFIRMATION)
+
+    results = [
+        measure(
+            "per_message",
+            args.messages,
+            lambda to: service.create_affirmation_email(AFFIRMATION, to).as_string(),
+        ),
+        measure(
+            "pre_encoded",
+            args.messages,
+            lambda to: service.address_message(encoded, to),
+        ),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
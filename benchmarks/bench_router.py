@@ -0,0 +1,97 @@
+"""Tail latency of a single provider vs. the hedged router, fully offline.
+
+Stub providers draw latencies from a long-tailed distribution, so the effect
+of hedging on p99 is visible without any network access:
+
+    python -m benchmarks.bench_router --requests 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from providers import AffirmationProvider, HedgedRouter  # noqa: E402
+
+
+class StubProvider(AffirmationProvider):
+    """Usually answers in ``typical`` seconds, but ``tail_rate`` of calls take ``tail``."""
+
+    def __init__(self, name: str, typical: float, tail: float, tail_rate: float, fail_rate: float = 0.0):
+        self.name = name
+        self.typical = typical
+        self.tail = tail
+        self.tail_rate = tail_rate
+        self.fail_rate = fail_rate
+
+    async def generate(self) -> str:
+        slow = random.random() < self.tail_rate
+        await asyncio.sleep(self.tail if slow else random.uniform(0.5, 1.5) * self.typical)
+        if random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.name} failed")
+        return f"affirmation from {self.name}"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+async def measure(label: str, router: HedgedRouter, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await router.generate()
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return {
+        "mode": label,
+        "requests": requests,
+        "failures": failures,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "router": router.stats(),
+    }
+
+
+async def run(requests: int, concurrency: int):
+    primary = StubProvider("primary", typical=0.05, tail=1.0, tail_rate=0.05, fail_rate=0.01)
+    secondary = StubProvider("secondary", typical=0.08, tail=1.0, tail_rate=0.05)
+    local = StubProvider("local", typical=0.001, tail=0.001, tail_rate=0.0)
+
+    return [
+        await measure("single", HedgedRouter([primary], default_deadline=0.2), requests, concurrency),
+        await measure(
+            "hedged",
+            HedgedRouter([primary, secondary, local], default_deadline=0.2),
+            requests,
+            concurrency,
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
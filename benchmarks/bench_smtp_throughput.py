@@ -0,0 +1,71 @@
+"""Compare EmailService throughput with and without pooled SMTP sessions.
+
+Runs against a local stub SMTP server, so no credentials are needed:
+
+    python -m benchmarks.bench_smtp_throughput --messages 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import smtplib
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubSMTPServer  # noqa: E402
+
+
+def send_unpooled(service, text: str):
+    """The previous behaviour: a fresh connection and login per message."""
+    with smtplib.SMTP(service.smtp_server, service.smtp_port) as server:
+        server.login(service.sender_email, service.sender_password)
+        server.sendmail(service.sender_email, service.recipient_email, text)
+
+
+def measure(label: str, count: int, send) -> dict:
+    start = time.perf_counter()
+    for _ in range(count):
+        send()
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": label,
+        "messages": count,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(count / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.002, help="per-reply delay (s)")
+    parser.add_argument("--handshake", type=float, default=0.02, help="connect/auth delay (s)")
+    args = parser.parse_args()
+    logging.getLogger("email_service").setLevel(logging.WARNING)
+
+    with StubSMTPServer(latency=args.latency, handshake_delay=args.handshake) as stub:
+        stub.configure_env(os.environ)
+
+        from email_service import EmailService
+
+        service = EmailService()
+        text = service.create_affirmation_email("You are wonderful.").as_string()
+
+        results = [
+            measure("unpooled", args.messages, lambda: send_unpooled(service, text)),
+            measure(
+                "pooled",
+                args.messages,
+                lambda: service.send_affirmation_email("You are wonderful."),
+            ),
+        ]
+        service.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Import-time budget for the API module.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter and
+exits non-zero if the median cumulative import time over several runs
+exceeds the budget, or if a heavy client library is imported before it is
+needed:
+
+    python -m benchmarks.check_import_time --budget-ms 450
+
+Single imports ranged from 339 to 518 ms on a shared runner, so one run (or
+the fastest of a few) is too noisy to gate on. The median of 7 runs drops
+the outliers; the 450 ms default sits ~100 ms above the low end of that
+range for runner noise, while an eagerly imported client library (openai
+alone costs ~500 ms) still fails the check.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only loaded once the corresponding service is first used
+LAZY_MODULES = ("openai", "apscheduler", "jinja2", "httpx", "requests")
+
+
+def import_times(module: str, runs: int) -> dict:
+    """Self and cumulative import time (µs) per imported module, median of ``runs``."""
+    samples = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, OUTBOX_DB=os.path.join(tmp, "outbox.db"))
+        env["HISTORY_DB"] = os.path.join(tmp, "history.db")
+        env.setdefault("OPENAI_API_KEY", "sk-import-check")
+        for _ in range(runs):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                cwd=ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            for line in result.stderr.splitlines():
+                if not line.startswith("import time:"):
+                    continue
+                own, cumulative, name = line[len("import time:"):].split("|")
+                if not own.strip().isdigit():
+                    continue  # header line
+                name = name.strip()
+                samples.setdefault(name, []).append((int(own), int(cumulative)))
+    return {
+        name: (
+            int(statistics.median(own for own, _ in times)),
+            int(statistics.median(cumulative for _, cumulative in times)),
+        )
+        for name, times in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=450)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    times = import_times(args.module, args.runs)
+    total_ms = times[args.module][1] / 1000
+    slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)
+    eager = sorted({name.split(".")[0] for name in times} & set(LAZY_MODULES))
+
+    report = {
+        "module": args.module,
+        "import_ms": round(total_ms, 1),
+        "budget_ms": args.budget_ms,
+        "slowest_self_ms": {
+            name: round(own / 1000, 1) for name, (own, _) in slowest[: args.top]
+        },
+        "eager_heavy_imports": eager,
+    }
+    print(json.dumps(report, indent=2))
+
+    if total_ms > args.budget_ms:
+        print(
+            f"FAIL: importing {args.module} took {total_ms:.0f} ms "
+            f"(median of {args.runs} runs, budget {args.budget_ms:.0f} ms)"
+        )
+        sys.exit(1)
+    if eager:
+        print(f"FAIL: {', '.join(eager)} imported at startup instead of on first use")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Multi-process check of scheduler leader election.
+
+Starts several processes campaigning for the same SQLite lease, samples
+which of them believe they hold it, then kills the leader and finally stops
+the next one gracefully. Exits non-zero if two processes ever lead at once:
+
+    python -m benchmarks.check_leader_election --processes 4 --ttl 1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def campaign(index: int, path: str, ttl: float, flags, stop_event):
+    from leadership import LeaderElection, SQLiteLease
+
+    logging.getLogger("leadership").setLevel(logging.ERROR)
+
+    async def run():
+        election = LeaderElection(SQLiteLease("scheduler", path=path, ttl=ttl), ttl / 4)
+        election.start()
+        while not stop_event.is_set():
+            flags[index] = 1 if election.holds_lease() else 0
+            await asyncio.sleep(0.01)
+        flags[index] = 0
+        await election.stop()
+
+    asyncio.run(run())
+
+
+def sample(flags, duration: float, watch):
+    """Poll leader flags; returns (max concurrent leaders, seconds until ``watch`` is true)."""
+    start = time.perf_counter()
+    worst, reached = 0, None
+    while time.perf_counter() - start < duration:
+        worst = max(worst, sum(flags))
+        if reached is None and watch(list(flags)):
+            reached = time.perf_counter() - start
+        time.sleep(0.005)
+    return worst, reached
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--ttl", type=float, default=1.0)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    flags = ctx.Array("i", args.processes)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "leader.db")
+        stops = [ctx.Event() for _ in range(args.processes)]
+        procs = [
+            ctx.Process(target=campaign, args=(i, path, args.ttl, flags, stops[i]))
+            for i in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+
+        worst, elected = sample(flags, 3 * args.ttl, lambda f: sum(f) == 1)
+        leader = list(flags).index(1) if sum(flags) == 1 else None
+
+        # Crash the leader: a follower must take over once the lease expires
+        failover_worst, failover = None, None
+        if leader is not None:
+            procs[leader].kill()
+            procs[leader].join()
+            flags[leader] = 0
+            failover_worst, failover = sample(flags, 3 * args.ttl, lambda f: sum(f) == 1)
+            worst = max(worst, failover_worst)
+
+        # Stop the new leader cleanly: it releases the lease for a fast handover
+        handover = None
+        if sum(flags) == 1:
+            leader = list(flags).index(1)
+            stops[leader].set()
+            procs[leader].join()
+            handover_worst, handover = sample(
+                flags, 3 * args.ttl, lambda f: sum(f) == 1 and f[leader] == 0
+            )
+            worst = max(worst, handover_worst)
+
+        for stop in stops:
+            stop.set()
+        for proc in procs:
+            proc.join(5)
+
+    report = {
+        "processes": args.processes,
+        "lease_ttl_s": args.ttl,
+        "first_election_s": round(elected, 3) if elected is not None else None,
+        "failover_after_crash_s": round(failover, 3) if failover is not None else None,
+        "handover_after_stop_s": round(handover, 3) if handover is not None else None,
+        "max_concurrent_leaders": worst,
+    }
+    print(json.dumps(report, indent=2))
+    if worst > 1 or None in (elected, failover, handover):
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
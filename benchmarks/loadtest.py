@@ -0,0 +1,440 @@
+"""Reproducible load tests for the API against local stub upstreams.
+
+Starts stub OpenAI, affirmations.dev and SMTP servers, runs the API in its
+own uvicorn process for each scenario and writes throughput, latency
+percentiles, CPU time and RSS to JSON, so runs can be compared across
+commits:
+
+    python -m benchmarks.loadtest --duration 10 --concurrency 20 --output new.json
+    python -m benchmarks.loadtest --baseline old.json --output new.json
+
+Scenarios: get_affirmation, send_email, send_email_replay, daily_send,
+dashboard. With
+``--baseline`` the run exits non-zero if any scenario's RPS dropped or its
+p95 grew by more than ``--tolerance``.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import (  # noqa: E402
+    StubAffirmationsServer,
+    StubCompletionServer,
+    StubSMTPServer,
+)
+
+SCENARIOS = ("get_affirmation", "send_email", "send_email_replay", "daily_send", "dashboard")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    if not latencies:
+        return {"requests": 0, "errors": errors, "elapsed_s": round(elapsed, 3)}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+class ProcessStats:
+    """CPU time and memory of another process, read from /proc (Linux only)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.available = os.path.exists(f"/proc/{pid}/stat")
+
+    def cpu_seconds(self):
+        if not self.available:
+            return None
+        with open(f"/proc/{self.pid}/stat") as f:
+            # Fields after the parenthesised command name; utime and stime are 14 and 15
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def memory_mb(self) -> dict:
+        if not self.available:
+            return {"rss_mb": None, "peak_rss_mb": None}
+        values = {}
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = round(int(value.split()[0]) / 1024, 1)
+        return {"rss_mb": values.get("VmRSS"), "peak_rss_mb": values.get("VmHWM")}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def api_env(stubs, workdir: str) -> dict:
+    completion, affirmations, smtp = stubs
+    env = dict(os.environ)
+    for var in ("RECIPIENT_EMAILS", "RECIPIENTS_FILE", "SENDER_EMAIL", "SENDER_PASSWORD"):
+        env.pop(var, None)
+    smtp.configure_env(env)
+    env.update(
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=completion.base_url,
+        AFFIRMATIONS_URL=affirmations.url,
+        HISTORY_DB=os.path.join(workdir, "history.db"),
+        OUTBOX_DB=os.path.join(workdir, "outbox.db"),
+        IDEMPOTENCY_DB=os.path.join(workdir, "idempotency.db"),
+        LEADER_DB=os.path.join(workdir, "leader.db"),
+        EVENT_LOG_DIR=os.path.join(workdir, "event_log"),
+        PYTHONUNBUFFERED="1",
+    )
+    return env
+
+
+def start_api(env: dict, port: int) -> subprocess.Popen:
+    import httpx
+
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("API did not start within 30s")
+
+
+def stop_api(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def drive(client, concurrency: int, duration: float, request):
+    """Closed-loop load: ``concurrency`` workers calling ``request`` until time is up."""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        nonlocal errors
+        iteration = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = await request(client, index, iteration)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+            iteration += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def get_affirmation(client, index, iteration):
+    response = await client.get("/get-affirmation")
+    return response.status_code == 200
+
+
+def send_email_client():
+    """Sends a new email per request: each one gets its own Idempotency-Key.
+
+    Without a key every request after the first would replay the default
+    ``send-email:<recipient>:<date>`` result instead of sending.
+    """
+    run = uuid.uuid4().hex[:8]
+
+    async def request(client, index, iteration):
+        headers = {"Idempotency-Key": f"loadtest-{run}-{index}-{iteration}"}
+        response = await client.post("/send-email", headers=headers)
+        return response.status_code == 200
+
+    return request
+
+
+def send_email_replay_client():
+    """Repeats one Idempotency-Key: the first request sends, the rest are replays."""
+    key = f"loadtest-replay-{uuid.uuid4().hex[:8]}"
+
+    async def request(client, index, iteration):
+        response = await client.post("/send-email", headers={"Idempotency-Key": key})
+        return response.status_code == 200
+
+    return request
+
+
+def dashboard_client():
+    """One open dashboard: polls status, revalidating the page now and then."""
+    etags = {}
+
+    async def request(client, index, iteration):
+        if iteration % 10 == 0:
+            headers = {"Accept-Encoding": "gzip"}
+            if index in etags:
+                headers["If-None-Match"] = etags[index]
+            response = await client.get("/", headers=headers)
+            etags[index] = response.headers.get("etag", "")
+            return response.status_code in (200, 304)
+        response = await client.get("/scheduler-status")
+        return response.status_code == 200
+
+    return request
+
+
+async def wait_for_outbox(client, timeout: float = 120) -> float:
+    """Seconds until every queued email has been sent or dead-lettered."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        stats = (await client.get("/outbox-status")).json()
+        if stats["pending"] + stats["sending"] == 0:
+            break
+        await asyncio.sleep(0.1)
+    return time.perf_counter() - start
+
+
+async def run_http_scenario(name: str, base_url: str, args, stats: ProcessStats, smtp) -> dict:
+    import httpx
+
+    request = {
+        "get_affirmation": get_affirmation,
+        "send_email": send_email_client(),
+        "send_email_replay": send_email_replay_client(),
+        "dashboard": dashboard_client(),
+    }[name]
+    limits = httpx.Limits(max_connections=args.concurrency + 5)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        # Let startup warm-up and the first pool refill settle before measuring
+        await asyncio.sleep(args.warmup)
+        sent_before = smtp.messages
+        cpu_before = stats.cpu_seconds()
+
+        result = await drive(client, args.concurrency, args.duration, request)
+        if name in ("send_email", "send_email_replay"):
+            result["drain_s"] = round(await wait_for_outbox(client), 3)
+            result["delivered"] = smtp.messages - sent_before
+
+        cpu_after = stats.cpu_seconds()
+    return {**result, **cpu_fields(cpu_before, cpu_after, result["elapsed_s"]), **stats.memory_mb()}
+
+
+def cpu_fields(before, after, elapsed: float) -> dict:
+    if before is None or after is None:
+        return {"cpu_s": None, "cpu_percent": None}
+    cpu = after - before
+    return {"cpu_s": round(cpu, 3), "cpu_percent": round(cpu / elapsed * 100, 1)}
+
+
+def daily_send_worker(env: dict, recipients: int, results):
+    """Run one daily send to ``recipients`` addresses through the outbox."""
+    os.environ.clear()
+    os.environ.update(env, LEADER_ELECTION="false")
+    os.chdir(ROOT)
+    logging.disable(logging.WARNING)
+
+    import sqlite3
+
+    from services import Services
+
+    services = Services()
+    scheduler, outbox = services.scheduler, services.outbox
+    outbox.start()
+    addresses = [f"reader{i}@example.com" for i in range(recipients)]
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    scheduler.send_daily_affirmation(addresses)
+    queued = time.perf_counter() - start
+    while True:
+        counts = outbox.backend.counts()
+        if counts["pending"] + counts["sending"] == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    # Per-email latency from enqueue to delivery
+    with sqlite3.connect(env["OUTBOX_DB"]) as conn:
+        latencies = [
+            row[0]
+            for row in conn.execute(
+                "SELECT updated_at - created_at FROM outbox WHERE status = 'sent'"
+            )
+        ]
+    cpu = (usage_after.ru_utime + usage_after.ru_stime) - (
+        usage_before.ru_utime + usage_before.ru_stime
+    )
+    result = summarize(latencies, counts["dead"], elapsed)
+    result.update(
+        {
+            "recipients": recipients,
+            "enqueue_s": round(queued, 3),
+            "cpu_s": round(cpu, 3),
+            "cpu_percent": round(cpu / elapsed * 100, 1),
+            "rss_mb": None,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": round(usage_after.ru_maxrss / 1024, 1),
+        }
+    )
+    outbox.close()
+    services.history.close()
+    results.put(result)
+
+
+def run_daily_send(env: dict, args) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=daily_send_worker, args=(env, args.recipients, results))
+    process.start()
+    result = results.get(timeout=300)
+    process.join()
+    return result
+
+
+def run_scenario(name: str, stubs, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = api_env(stubs, workdir)
+        if name == "daily_send":
+            return run_daily_send(env, args)
+
+        port = free_port()
+        process = start_api(env, port)
+        try:
+            return asyncio.run(
+                run_http_scenario(
+                    name, f"http://127.0.0.1:{port}", args, ProcessStats(process.pid), stubs[2]
+                )
+            )
+        finally:
+            stop_api(process)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, report: dict, tolerance: float) -> list:
+    """Scenarios whose RPS dropped or p95 grew by more than ``tolerance``."""
+    regressions = []
+    for name, result in report["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old or not old.get("rps") or not result.get("rps"):
+            continue
+        if result["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {old['rps']} -> {result['rps']}")
+        if result["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']}ms -> {result['p95_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds before measuring")
+    parser.add_argument("--recipients", type=int, default=1000, help="daily_send size")
+    parser.add_argument("--openai-delay", type=float, default=0.3, help="stub completion delay (s)")
+    parser.add_argument("--affirmations-delay", type=float, default=0.05)
+    parser.add_argument("--smtp-latency", type=float, default=0.002)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with StubCompletionServer(delay=args.openai_delay, distinct=True) as completion, \
+            StubAffirmationsServer(delay=args.affirmations_delay) as affirmations, \
+            StubSMTPServer(latency=args.smtp_latency) as smtp:
+        stubs = (completion, affirmations, smtp)
+        scenarios = {}
+        for name in names:
+            print(f"Running {name}...", file=sys.stderr)
+            scenarios[name] = run_scenario(name, stubs, args)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "recipients": args.recipients,
+            "openai_delay_s": args.openai_delay,
+            "affirmations_delay_s": args.affirmations_delay,
+            "smtp_latency_s": args.smtp_latency,
+        },
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Local stand-ins for the upstream services, used by the benchmarks."""
+
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+STUB_AFFIRMATION = "You are the calm in every storm I weather."
+
+_WORDS = (
+    "brave kind gentle bright steady warm patient curious honest radiant strong "
+    "calm playful thoughtful generous hopeful wise tender joyful resilient loved "
+    "morning river garden lantern harbor meadow compass anchor melody sunrise "
+    "journey laughter courage kindness light home song spark horizon bloom"
+).split()
+
+
+def distinct_affirmation() -> str:
+    """A random sentence, so the history's near-duplicate check lets it through."""
+    return "You are " + " ".join(random.sample(_WORDS, 10)) + "."
+
+
+def _write_json(handler: BaseHTTPRequestHandler, payload: dict):
+    body = json.dumps(payload).encode()
+    handler.send_response(200)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.delay)
+
+        # Batched requests ask for "Write N distinct messages" and get a numbered list
+        prompt = " ".join(m.get("content", "") for m in request.get("messages", []))
+        match = re.search(r"Write (\d+) distinct", prompt)
+        count = int(match.group(1)) if match else 1
+        if self.server.distinct:
+            texts = [distinct_affirmation() for _ in range(count)]
+        elif match:
+            texts = [f"{STUB_AFFIRMATION} ({i})" for i in range(1, count + 1)]
+        else:
+            texts = [STUB_AFFIRMATION]
+        if match:
+            content = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+        else:
+            content = texts[0]
+        # Roughly 4 characters per token
+        prompt_tokens = len(prompt) // 4
+
+        _write_json(
+            self,
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4o",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": content,
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": 12 * count,
+                    "total_tokens": prompt_tokens + 12 * count,
+                },
+            },
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubCompletionServer:
+    """OpenAI-compatible chat completion server that answers after ``delay`` seconds.
+
+    With ``distinct`` every affirmation is a different random sentence
+    instead of the same fixed text.
+    """
+
+    def __init__(self, delay: float = 1.0, port: int = 0, distinct: bool = False):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _CompletionHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.delay = delay
+        self.httpd.distinct = distinct
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _AffirmationsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.requests += 1
+        _write_json(self, {"affirmation": distinct_affirmation()})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAffirmationsServer:
+    """affirmations.dev stand-in returning a random affirmation after ``delay`` seconds."""
+
+    def __init__(self, delay: float = 0.05, port: int = 0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _AffirmationsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.delay = delay
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/"
+
+    @property
+    def requests(self) -> int:
+        return self.httpd.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 stub ESMTP ready")
+        if self.server.handshake_delay:
+            time.sleep(self.server.handshake_delay)
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-stub\r\n250-AUTH PLAIN LOGIN\r\n")
+                self.reply("250 8BITMIME")
+            elif verb == "AUTH":
+                if self.server.handshake_delay:
+                    time.sleep(self.server.handshake_delay)
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply("250 2.0.0 Ok: queued")
+            elif verb == "QUIT":
+                self.reply("221 2.0.0 Bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self.reply("250 2.0.0 Ok")
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StubSMTPServer:
+    """Minimal SMTP sink (no STARTTLS) that counts delivered messages.
+
+    ``latency`` is added before every reply to emulate network round trips and
+    ``handshake_delay`` is paid on connect and on AUTH to emulate the TLS and
+    login cost of a real provider.
+    """
+
+    def __init__(self, latency: float = 0.002, handshake_delay: float = 0.02, port: int = 0):
+        self.server = _ThreadingSMTPServer(("127.0.0.1", port), _SMTPHandler)
+        self.server.latency = latency
+        self.server.handshake_delay = handshake_delay
+        self.server.messages = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def messages(self) -> int:
+        return self.server.messages
+
+    def configure_env(self, environ):
+        """Point EmailService at this server."""
+        environ["SMTP_SERVER"] = "127.0.0.1"
+        environ["SMTP_PORT"] = str(self.port)
+        environ["SMTP_STARTTLS"] = "false"
+        environ.setdefault("SENDER_EMAIL", "sender@example.com")
+        environ.setdefault("SENDER_PASSWORD", "stub")
+        environ.setdefault("RECIPIENT_EMAIL", "recipient@example.com")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Optional, Set
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class StatusBroadcaster:
+    """Push status snapshots to every connected dashboard.
+
+    A single watcher task builds the snapshot, either when ``notify`` is
+    called or every ``interval`` seconds, and publishes it only when it
+    differs from the last one. Each client has its own small bounded queue;
+    a slow client drops its oldest snapshot rather than holding up the
+    others, which is safe because every message is a complete snapshot.
+
+    Nothing is built while no client is connected, and the snapshot, which
+    reads SQLite, is built in a worker thread rather than on the loop.
+    """
+
+    def __init__(self, snapshot: Callable[[], dict], interval: Optional[float] = None, buffer_size: Optional[int] = None):
+        self.snapshot = snapshot
+        self.interval = interval or float(os.getenv("STATUS_PUSH_INTERVAL", "2"))
+        self.buffer_size = buffer_size or int(os.getenv("STATUS_CLIENT_BUFFER", "4"))
+
+        self.latest: Optional[str] = None
+        self.dropped = 0
+        self._clients: Set[asyncio.Queue] = set()
+        self._changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a client; it immediately receives the latest snapshot."""
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        if not self._clients and self._changed is not None:
+            # The latest snapshot may be stale after a spell without clients
+            self._changed.set()
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._clients.discard(queue)
+
+    def publish(self, message: str):
+        """Fan a serialized snapshot out to every client queue."""
+        if message == self.latest:
+            return
+        self.latest = message
+        for queue in self._clients:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+
+    def notify(self):
+        """Ask the watcher to rebuild the snapshot now. Safe from any thread."""
+        if self._loop is None or self._changed is None:
+            return
+        try:
+            if asyncio.get_running_loop() is self._loop:
+                self._changed.set()
+                return
+        except RuntimeError:
+            pass
+        self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            if not self._clients:
+                continue
+
+            try:
+                snapshot = await asyncio.to_thread(self.snapshot)
+                self.publish(json.dumps(snapshot, default=str))
+            except Exception as e:
+                logger.error(f"Error building status snapshot: {str(e)}")
+
+    def start(self):
+        """Start the watcher task on the running event loop."""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._changed = asyncio.Event()
+            self._changed.set()
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"clients": len(self._clients), "dropped": self.dropped}
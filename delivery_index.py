@@ -0,0 +1,132 @@
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bucket for recipients without their own delivery time; it follows the time
+# passed to AffirmationScheduler.start_scheduler
+DEFAULT_BUCKET = "default"
+
+
+def parse_delivery_time(value: str) -> Tuple[int, int]:
+    """Parse "HH:MM" into (hour, minute)."""
+    hour, _, minute = value.strip().partition(":")
+    hour, minute = int(hour), int(minute or 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid delivery time: {value}")
+    return hour, minute
+
+
+class DeliveryIndex:
+    """Recipients grouped into per-timezone minute buckets.
+
+    Each occupied bucket is served by a single scheduler job, so adding or
+    moving a recipient only touches two dict entries, and at most one job is
+    created or removed.
+    """
+
+    def __init__(self, default_timezone: Optional[str] = None):
+        self.default_timezone = default_timezone or os.getenv("DELIVERY_TIMEZONE")
+        if self.default_timezone:
+            self.validate_timezone(self.default_timezone)
+
+        # Bucket -> recipients (a dict keeps insertion order for stable batches)
+        self._buckets: Dict[object, Dict[str, None]] = {}
+        # Recipient -> bucket
+        self._slots: Dict[str, object] = {}
+
+    @staticmethod
+    def validate_timezone(timezone: str):
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone: {timezone}")
+
+    def bucket_for(
+        self,
+        hour: Optional[int] = None,
+        minute: Optional[int] = None,
+        timezone: Optional[str] = None,
+    ):
+        """Bucket key for a delivery time; no time means the default bucket."""
+        if hour is None:
+            return DEFAULT_BUCKET
+
+        minute = minute or 0
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"Invalid delivery time: {hour}:{minute}")
+
+        timezone = timezone or self.default_timezone
+        if timezone:
+            self.validate_timezone(timezone)
+        return (timezone, hour, minute)
+
+    def set(
+        self,
+        recipient: str,
+        hour: Optional[int] = None,
+        minute: Optional[int] = None,
+        timezone: Optional[str] = None,
+    ) -> Tuple[Optional[object], Optional[object]]:
+        """Add or move a recipient.
+
+        Returns ``(opened, closed)``: the bucket that just became occupied and
+        the one that just became empty, either of which may be ``None``.
+        """
+        bucket = self.bucket_for(hour, minute, timezone)
+        previous = self._slots.get(recipient)
+        if previous == bucket:
+            return None, None
+
+        closed = self._discard(recipient, previous) if previous is not None else None
+
+        members = self._buckets.get(bucket)
+        opened = None
+        if members is None:
+            members = self._buckets[bucket] = {}
+            opened = bucket
+        members[recipient] = None
+        self._slots[recipient] = bucket
+        return opened, closed
+
+    def remove(self, recipient: str) -> Tuple[bool, Optional[object]]:
+        """Remove a recipient; returns whether it was indexed and the bucket that became empty."""
+        bucket = self._slots.pop(recipient, None)
+        if bucket is None:
+            return False, None
+        return True, self._discard(recipient, bucket)
+
+    def _discard(self, recipient: str, bucket) -> Optional[object]:
+        members = self._buckets[bucket]
+        members.pop(recipient, None)
+        if not members:
+            del self._buckets[bucket]
+            return bucket
+        return None
+
+    def slot(self, recipient: str):
+        """Bucket a recipient is currently in, or ``None``."""
+        return self._slots.get(recipient)
+
+    def recipients(self, bucket) -> List[str]:
+        """Recipients due in a bucket."""
+        return list(self._buckets.get(bucket, ()))
+
+    def buckets(self) -> List[object]:
+        """All occupied buckets."""
+        return list(self._buckets)
+
+    @staticmethod
+    def label(bucket) -> str:
+        """Human-readable bucket name, also used in job ids."""
+        if bucket == DEFAULT_BUCKET:
+            return DEFAULT_BUCKET
+        timezone, hour, minute = bucket
+        return f"{hour:02d}:{minute:02d} {timezone or 'local'}"
+
+    def __len__(self) -> int:
+        return len(self._slots)
@@ -1,18 +1,185 @@
+import asyncio
 import smtplib
 import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
+from email.policy import compat32
 import os
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from delivery_index import parse_delivery_time
+from metrics import RENDER_LATENCY, SMTP_LATENCY, timed
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Templates are compiled once at import; only the per-message values are rendered
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+_templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+)
+HTML_TEMPLATE = _templates.get_template("affirmation_email.html")
+TEXT_TEMPLATE = _templates.get_template("affirmation_email.txt")
+
+# Messages are serialized with CRLF line endings so smtplib can send them as-is
+SMTP_POLICY = compat32.clone(linesep="\r\n")
+
+
+@lru_cache(maxsize=4)
+def day_strings(day: date) -> dict:
+    """Subject and date line for a given day."""
+    return {
+        "subject": f"💕 Your Daily Affirmation - {day.strftime('%B %d, %Y')}",
+        "long_date": day.strftime("%A, %B %d, %Y"),
+    }
+
+
+class SMTPConnectionPool:
+    """Pool of authenticated SMTP sessions reused across sends.
+
+    Connections are probed with NOOP when they have been idle for a while,
+    evicted after ``idle_timeout`` seconds and re-established when the
+    server drops them.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        use_starttls: bool = True,
+        max_size: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        probe_after: Optional[float] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_starttls = use_starttls
+        self.max_size = max_size or int(os.getenv("SMTP_POOL_SIZE", "4"))
+        self.idle_timeout = idle_timeout or float(
+            os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60")
+        )
+        self.probe_after = probe_after or float(
+            os.getenv("SMTP_POOL_PROBE_AFTER", "5")
+        )
+        self.timeout = float(os.getenv("SMTP_TIMEOUT", "30"))
+
+        self._context = ssl.create_default_context()
+        self._idle = []  # (server, last_used) pairs, most recently used last
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+
+    def _connect(self) -> smtplib.SMTP:
+        with timed(SMTP_LATENCY, "smtp_connect", phase="connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_starttls:
+                with timed(SMTP_LATENCY, "smtp_starttls", phase="starttls"):
+                    server.starttls(context=self._context)
+            with timed(SMTP_LATENCY, "smtp_login", phase="login"):
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout:
+                self._close(server)
+            elif idle_for > self.probe_after and not self._is_alive(server):
+                self._close(server)
+            else:
+                return server
+
+        return self._connect()
+
+    def _checkin(self, server: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Close connections that have been idle longer than ``idle_timeout``."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [server for server, last_used in self._idle if last_used < cutoff]
+            self._idle = [(s, t) for s, t in self._idle if t >= cutoff]
+        for server in expired:
+            self._close(server)
+
+    @contextmanager
+    def connection(self):
+        """Borrow an authenticated SMTP session from the pool."""
+        self._slots.acquire()
+        try:
+            server = self._checkout()
+            try:
+                yield server
+            except Exception as e:
+                # The session state is unknown after a failure, so don't reuse it
+                self._close(server)
+                if isinstance(e, smtplib.SMTPServerDisconnected):
+                    # Idle sessions were most likely dropped at the same time
+                    self.close()
+                raise
+            self._checkin(server)
+        finally:
+            self._slots.release()
+
+    def sendmail(self, from_addr: str, to_addrs, msg: str) -> dict:
+        """Send a message, reconnecting once if the server dropped the session."""
+        for attempt in range(2):
+            try:
+                with self.connection() as server:
+                    with timed(SMTP_LATENCY, "smtp_send", phase="send"):
+                        return server.sendmail(from_addr, to_addrs, msg)
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                logger.warning("SMTP connection was closed by the server, reconnecting...")
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
 
 class EmailService:
     def __init__(self):
@@ -21,81 +188,100 @@ class EmailService:
         self.sender_email = os.getenv("SENDER_EMAIL")
         self.sender_password = os.getenv("SENDER_PASSWORD")
         self.recipient_email = os.getenv("RECIPIENT_EMAIL")
+        # Recipient -> (hour, minute, timezone) for subscribers with their own delivery time
+        self.recipient_schedules = {}
+        self.recipients = self.load_recipients()
+        if not self.recipient_email and self.recipients:
+            self.recipient_email = self.recipients[0]
+        self.use_starttls = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
 
-        if not all([self.sender_email, self.sender_password, self.recipient_email]):
+        self.pool = SMTPConnectionPool(
+            self.smtp_server,
+            self.smtp_port,
+            self.sender_email,
+            self.sender_password,
+            use_starttls=self.use_starttls,
+        )
+
+        # (affirmation, day) -> message encoded without a To header
+        self._encoded = {}
+        self._encoded_lock = threading.Lock()
+
+        self.bulk_chunk_size = int(os.getenv("SMTP_BULK_CHUNK_SIZE", "50"))
+        self.bulk_sessions = int(
+            os.getenv("SMTP_BULK_SESSIONS", str(self.pool.max_size))
+        )
+
+        if not self.is_configured():
             logger.warning(
                 "Email configuration incomplete. Some environment variables are missing."
             )
 
-    def create_affirmation_email(self, affirmation: str) -> MIMEMultipart:
-        """Create a beautifully formatted email with the daily affirmation."""
+    def load_recipients(self) -> List[str]:
+        """Collect subscribers from RECIPIENT_EMAILS, RECIPIENTS_FILE and RECIPIENT_EMAIL.
+
+        Lines in RECIPIENTS_FILE may add a delivery time and timezone:
+        ``friend@example.com, 07:30, Europe/London``.
+        """
+        recipients = []
+
+        for address in os.getenv("RECIPIENT_EMAILS", "").split(","):
+            if address.strip():
+                recipients.append(address.strip())
+
+        recipients_file = os.getenv("RECIPIENTS_FILE")
+        if recipients_file:
+            try:
+                with open(recipients_file, encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith("#"):
+                            recipients.append(self._parse_recipient_line(line))
+            except OSError as e:
+                logger.error(f"Failed to read recipients file: {str(e)}")
+
+        if self.recipient_email:
+            recipients.insert(0, self.recipient_email)
+
+        # Drop duplicates, keeping the first occurrence
+        return list(dict.fromkeys(recipients))
+
+    def _parse_recipient_line(self, line: str) -> str:
+        address, *schedule = [field.strip() for field in line.split(",")]
+        if schedule and schedule[0]:
+            try:
+                hour, minute = parse_delivery_time(schedule[0])
+                timezone = schedule[1] if len(schedule) > 1 and schedule[1] else None
+                self.recipient_schedules[address] = (hour, minute, timezone)
+            except ValueError as e:
+                logger.error(f"Ignoring delivery time for {address}: {str(e)}")
+        return address
+
+    def is_configured(self) -> bool:
+        """Whether sender credentials and at least one recipient are set."""
+        return all([self.sender_email, self.sender_password, self.recipients])
+
+    def render_context(self, now: Optional[datetime] = None) -> dict:
+        """Date strings for one send run, computed once and shared by every message."""
+        now = now or datetime.now()
+        context = dict(day_strings(now.date()))
+        context["sent_at"] = now.strftime("%I:%M %p")
+        return context
+
+    def _build_message(
+        self, affirmation: str, context: Optional[dict] = None
+    ) -> MIMEMultipart:
+        context = context or self.render_context()
 
         # Create message container
         msg = MIMEMultipart("alternative")
         msg["From"] = self.sender_email
-        msg["To"] = self.recipient_email
-        msg["Subject"] = (
-            f"💕 Your Daily Affirmation - {datetime.now().strftime('%B %d, %Y')}"
-        )
+        msg["Subject"] = context["subject"]
 
-        # Create HTML content
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Daily Affirmation</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); min-height: 100vh;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: rgba(255, 255, 255, 0.95); border-radius: 20px; padding: 40px; text-align: center; box-shadow: 0 20px 40px rgba(0, 0, 0, 0.1); backdrop-filter: blur(10px);">
-                    
-                    <!-- Header -->
-                    <div style="margin-bottom: 30px;">
-                        <h1 style="color: #333; font-size: 28px; margin: 0; text-shadow: 1px 1px 2px rgba(0,0,0,0.1);">
-                            💕 Here when I can't be there 💕
-                        </h1>
-                        <p style="color: #666; font-size: 16px; margin: 10px 0 0 0;">
-                            {datetime.now().strftime('%A, %B %d, %Y')}
-                        </p>
-                    </div>
-                    
-                    <!-- Affirmation Card -->
-                    <div style="background: linear-gradient(45deg, #ff6b6b, #ee5a24); border-radius: 15px; padding: 30px; margin: 20px 0; color: white; box-shadow: 0 10px 30px rgba(255, 107, 107, 0.3);">
-                        <p style="font-size: 20px; line-height: 1.6; margin: 0; font-weight: 500; text-shadow: 1px 1px 2px rgba(0,0,0,0.2);">
-                            {affirmation}
-                        </p>
-                    </div>
-                    
-                    <!-- Footer -->
-                    <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee;">
-                        <p style="color: #888; font-size: 14px; margin: 0;">
-                            Made with ❤️ by your baby
-                        </p>
-                        <p style="color: #aaa; font-size: 12px; margin: 5px 0 0 0;">
-                            This message was sent automatically at {datetime.now().strftime('%I:%M %p')}
-                        </p>
-                    </div>
-                    
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-
-        # Create plain text version
-        text_content = f"""
-        💕 Here when I can't be there 💕
-        
-        {datetime.now().strftime('%A, %B %d, %Y')}
-        
-        Your daily affirmation:
-        {affirmation}
-        
-        Made with ❤️ by your baby
-        Sent at {datetime.now().strftime('%I:%M %p')}
-        """
+        # Render the precompiled templates
+        with timed(RENDER_LATENCY, "render"):
+            text_content = TEXT_TEMPLATE.render(affirmation=affirmation, **context)
+            html_content = HTML_TEMPLATE.render(affirmation=affirmation, **context)
 
         # Attach parts
         part1 = MIMEText(text_content, "plain")
@@ -106,6 +292,60 @@ class EmailService:
 
         return msg
 
+    def create_affirmation_email(
+        self,
+        affirmation: str,
+        recipient: Optional[str] = None,
+        context: Optional[dict] = None,
+    ) -> MIMEMultipart:
+        """Create a beautifully formatted email with the daily affirmation."""
+        msg = self._build_message(affirmation, context)
+        msg["To"] = recipient or self.recipient_email
+        return msg
+
+    def encode_affirmation_email(
+        self, affirmation: str, context: Optional[dict] = None
+    ) -> bytes:
+        """Serialize the email once, without a To header, ready for ``address_message``."""
+        return self._build_message(affirmation, context).as_bytes(policy=SMTP_POLICY)
+
+    @staticmethod
+    def address_message(encoded: bytes, recipient: str) -> bytes:
+        """Prepend the only per-recipient header to a pre-encoded message."""
+        return b"To: " + recipient.encode() + b"\r\n" + encoded
+
+    def _encoded_for(self, affirmation: str) -> bytes:
+        """Pre-encoded message for an affirmation, reused across recipients of a run.
+
+        Keyed on the day as well, since the Subject and date strings are baked
+        in: a retry or a reused affirmation sent after midnight is re-encoded
+        with that day's date.
+        """
+        now = datetime.now()
+        key = (affirmation, now.date())
+        with self._encoded_lock:
+            encoded = self._encoded.get(key)
+            if encoded is None:
+                encoded = self.encode_affirmation_email(affirmation, self.render_context(now))
+                self._encoded[key] = encoded
+                # Keep only the last few runs
+                while len(self._encoded) > 8:
+                    self._encoded.pop(next(iter(self._encoded)))
+        return encoded
+
+    def deliver(self, affirmation: str, recipient: str):
+        """Send one affirmation email, raising on failure."""
+        if not all([self.sender_email, self.sender_password]):
+            raise RuntimeError("Missing email configuration")
+
+        # Send email over a pooled, already authenticated session
+        self.pool.sendmail(
+            self.sender_email,
+            recipient,
+            self.address_message(self._encoded_for(affirmation), recipient),
+        )
+        logger.info(f"Daily affirmation email sent successfully to {recipient}")
+
     def send_affirmation_email(self, affirmation: str) -> bool:
         """Send the daily affirmation email."""
 
@@ -114,38 +354,144 @@ class EmailService:
             return False
 
         try:
-            # Create email message
-            msg = self.create_affirmation_email(affirmation)
+            self.deliver(affirmation, self.recipient_email)
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to send email: {str(e)}")
+            return False
+
+    def send_bulk(
+        self,
+        affirmation: str,
+        recipients: Optional[List[str]] = None,
+        chunk_size: Optional[int] = None,
+        parallel_sessions: Optional[int] = None,
+    ) -> Dict[str, bool]:
+        """Send the affirmation to many recipients, reusing pooled sessions.
+
+        Recipients are split into chunks of ``chunk_size``; each chunk is sent
+        as consecutive ``sendmail`` transactions on one authenticated session,
+        with up to ``parallel_sessions`` chunks in flight. Returns whether the
+        message was accepted for each recipient.
+        """
+        recipients = recipients if recipients is not None else self.recipients
+        chunk_size = chunk_size or self.bulk_chunk_size
+        parallel_sessions = parallel_sessions or self.bulk_sessions
+
+        if not all([self.sender_email, self.sender_password]):
+            logger.error("Cannot send email: Missing email configuration")
+            return {recipient: False for recipient in recipients}
 
-            # Create secure connection
-            context = ssl.create_default_context()
+        # Render and encode once; only the To header differs per recipient
+        encoded = self.encode_affirmation_email(affirmation)
+        chunks = [
+            recipients[i : i + chunk_size]
+            for i in range(0, len(recipients), chunk_size)
+        ]
 
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
+        results = {}
+        with ThreadPoolExecutor(max_workers=parallel_sessions) as executor:
+            for chunk_results in executor.map(
+                lambda chunk: self._send_chunk(encoded, chunk), chunks
+            ):
+                results.update(chunk_results)
 
-                # Send email
-                text = msg.as_string()
-                server.sendmail(self.sender_email, self.recipient_email, text)
+        sent = sum(results.values())
+        logger.info(f"Bulk send finished: {sent}/{len(recipients)} delivered")
+        return results
+
+    async def send_bulk_async(
+        self,
+        affirmation: str,
+        recipients: Optional[List[str]] = None,
+        chunk_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> Dict[str, bool]:
+        """Coroutine version of ``send_bulk`` for the asyncio scheduler.
+
+        Each chunk is a coroutine; at most ``max_concurrency`` of them hold a
+        pooled SMTP session at once, with the blocking SMTP exchange running
+        in a worker thread.
+        """
+        recipients = recipients if recipients is not None else self.recipients
+        chunk_size = chunk_size or self.bulk_chunk_size
+        semaphore = asyncio.Semaphore(max_concurrency or self.bulk_sessions)
+
+        if not all([self.sender_email, self.sender_password]):
+            logger.error("Cannot send email: Missing email configuration")
+            return {recipient: False for recipient in recipients}
 
-            logger.info(
-                f"Daily affirmation email sent successfully to {self.recipient_email}"
+        encoded = self.encode_affirmation_email(affirmation)
+
+        async def send_chunk(chunk):
+            async with semaphore:
+                return await asyncio.to_thread(self._send_chunk, encoded, chunk)
+
+        results = {}
+        for chunk_results in await asyncio.gather(
+            *(
+                send_chunk(recipients[i : i + chunk_size])
+                for i in range(0, len(recipients), chunk_size)
             )
-            return True
+        ):
+            results.update(chunk_results)
 
-        except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
-            return False
+        sent = sum(results.values())
+        logger.info(f"Bulk send finished: {sent}/{len(recipients)} delivered")
+        return results
+
+    def _send_chunk(self, encoded: bytes, chunk: List[str]) -> Dict[str, bool]:
+        """Send one chunk of recipients over a single pooled session."""
+        results = {}
+        pending = list(chunk)
+        reconnects = 0
+
+        while pending:
+            try:
+                with self.pool.connection() as server:
+                    while pending:
+                        recipient = pending[0]
+                        try:
+                            with timed(SMTP_LATENCY, "smtp_send", phase="send"):
+                                server.sendmail(
+                                    self.sender_email,
+                                    recipient,
+                                    self.address_message(encoded, recipient),
+                                )
+                            results[recipient] = True
+                        except (
+                            smtplib.SMTPRecipientsRefused,
+                            smtplib.SMTPDataError,
+                        ) as e:
+                            logger.error(f"Failed to send email to {recipient}: {str(e)}")
+                            results[recipient] = False
+                            server.rset()
+                        pending.pop(0)
+            except smtplib.SMTPServerDisconnected:
+                reconnects += 1
+                if reconnects > 1:
+                    break
+                logger.warning("SMTP connection was closed by the server, reconnecting...")
+            except Exception as e:
+                logger.error(f"Failed to send email batch: {str(e)}")
+                break
+
+        for recipient in pending:
+            results[recipient] = False
+        return results
 
     def test_email_connection(self) -> bool:
         """Test the email configuration and connection."""
         try:
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
+            with self.pool.connection() as server:
+                server.noop()
             logger.info("Email connection test successful")
             return True
         except Exception as e:
             logger.error(f"Email connection test failed: {str(e)}")
             return False
+
+    def close(self):
+        """Close pooled SMTP connections."""
+        self.pool.close()
@@ -0,0 +1,458 @@
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per log directory
+    fcntl = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Each process appends to its own active file, named after its pid
+ACTIVE_PATTERN = "events*.jsonl"
+MANIFEST_FILE = "manifest.json"
+# Held while allocating segment numbers and rewriting the manifest
+LOCK_FILE = "manifest.lock"
+
+
+def _schema():
+    """Columns of every event; ts is seconds since the epoch."""
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("ts", pa.float64()),
+            ("kind", pa.string()),
+            ("status", pa.string()),
+            ("recipient", pa.string()),
+            ("source", pa.string()),
+            ("message_id", pa.int64()),
+            ("latency_ms", pa.float64()),
+            ("detail", pa.string()),
+        ]
+    )
+
+
+def parse_time(value: Optional[str], end: bool = False) -> Optional[float]:
+    """Epoch seconds for an ISO date or datetime (local time unless it has an offset).
+
+    A bare date as ``end`` means the end of that day, so ranges include it.
+    """
+    if not value:
+        return None
+    if len(value) == 10:
+        day = date.fromisoformat(value)
+        if end:
+            day += timedelta(days=1)
+        return datetime.combine(day, datetime.min.time()).timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def segment_stats(rows: List[dict]) -> dict:
+    """Min/max and value sets used to skip a segment without opening it."""
+    recipients = [row["recipient"] for row in rows if row.get("recipient")]
+    return {
+        "rows": len(rows),
+        "ts_min": min(row["ts"] for row in rows),
+        "ts_max": max(row["ts"] for row in rows),
+        "recipient_min": min(recipients) if recipients else None,
+        "recipient_max": max(recipients) if recipients else None,
+        "kinds": sorted({row["kind"] for row in rows}),
+        "statuses": sorted({row["status"] for row in rows}),
+    }
+
+
+def _prunable(entry: dict, start, end, recipient, status, kind) -> bool:
+    """Whether a segment's stats rule out every row matching the query."""
+    if start is not None and entry["ts_max"] < start:
+        return True
+    if end is not None and entry["ts_min"] >= end:
+        return True
+    if status is not None and status not in entry["statuses"]:
+        return True
+    if kind is not None and kind not in entry["kinds"]:
+        return True
+    if recipient is not None:
+        low, high = entry["recipient_min"], entry["recipient_max"]
+        return low is None or not low <= recipient <= high
+    return False
+
+
+def _matches(row: dict, start, end, recipient, status, kind) -> bool:
+    return (
+        (start is None or row["ts"] >= start)
+        and (end is None or row["ts"] < end)
+        and (recipient is None or row.get("recipient") == recipient)
+        and (status is None or row["status"] == status)
+        and (kind is None or row["kind"] == kind)
+    )
+
+
+class EventLog:
+    """Append-only log of generation and send events.
+
+    ``record`` only puts the event on a queue; a writer thread appends
+    batches of them to a JSON-lines file. Once that file holds
+    ``segment_rows`` events, or a new day starts, it is rotated into an
+    immutable zstd-compressed Parquet segment. The manifest keeps each
+    segment's time and recipient min/max and its statuses, so queries only
+    open the segments that can match.
+
+    Several worker processes can share a directory: each appends to its own
+    active file, and segment numbering and manifest updates happen under a
+    file lock, re-reading the manifest first. An active file left by a
+    process that exited is rotated by the next one to start.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_rows: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_queue: Optional[int] = None,
+    ):
+        self.directory = directory or os.getenv("EVENT_LOG_DIR", "event_log")
+        self.segment_rows = segment_rows or int(os.getenv("EVENT_LOG_SEGMENT_ROWS", "10000"))
+        self.flush_interval = flush_interval or float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "1"))
+        self.batch_size = int(os.getenv("EVENT_LOG_BATCH_SIZE", "500"))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue(
+            maxsize=max_queue or int(os.getenv("EVENT_LOG_MAX_QUEUE", "10000"))
+        )
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        self.written = 0
+        self.dropped = 0
+        self.segments_scanned = 0
+        self.segments_pruned = 0
+
+        self._active_path = self._path(f"events-{os.getpid()}.jsonl")
+        self._manifest_mtime = None
+        with self._locked():
+            self._manifest: List[dict] = self._load_manifest()
+            self._recover_rotations()
+            # Opened under the lock so no other process takes it for an orphan
+            self._file = self._open_active()
+            self._adopt_orphans()
+        # Events in the active file, kept in memory so queries don't reread it
+        self._active: List[dict] = self._read_jsonl(self._active_path)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the manifest across processes."""
+        with open(self._path(LOCK_FILE), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open_active(self):
+        # Held locked for as long as this process writes to it
+        f = open(self._active_path, "a", encoding="utf-8")
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+
+    def _load_manifest(self) -> List[dict]:
+        try:
+            with open(self._path(MANIFEST_FILE), encoding="utf-8") as f:
+                self._manifest_mtime = os.fstat(f.fileno()).st_mtime_ns
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _refresh_manifest(self):
+        """Pick up segments other processes have added since the last read."""
+        try:
+            mtime = os.stat(self._path(MANIFEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            manifest = self._load_manifest()
+            with self._lock:
+                self._manifest = manifest
+
+    def _next_seq(self) -> int:
+        # Also skip segments whose conversion failed and awaits a retry
+        pending = [
+            self._seq(rotating) for rotating in glob.glob(self._path("segment-*.jsonl"))
+        ]
+        return max([entry["seq"] for entry in self._manifest] + pending, default=0) + 1
+
+    @staticmethod
+    def _seq(rotating: str) -> int:
+        return int(os.path.basename(rotating)[len("segment-") : -len(".jsonl")])
+
+    def _save_manifest(self):
+        temp = self._path(MANIFEST_FILE + ".tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        os.replace(temp, self._path(MANIFEST_FILE))
+
+    @staticmethod
+    def _read_jsonl(path: str) -> List[dict]:
+        rows = []
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A torn last line from a crash mid-write
+                        logger.warning(f"Skipping unreadable event in {path}")
+        except FileNotFoundError:
+            pass
+        return rows
+
+    def record(
+        self,
+        kind: str,
+        status: str,
+        recipient: Optional[str] = None,
+        source: Optional[str] = None,
+        message_id: Optional[int] = None,
+        latency_ms: Optional[float] = None,
+        detail: Optional[str] = None,
+    ):
+        """Queue an event; never blocks, and drops it if the writer has fallen behind."""
+        event = {
+            "ts": time.time(),
+            "kind": kind,
+            "status": status,
+            "recipient": recipient,
+            "source": source,
+            "message_id": message_id,
+            "latency_ms": round(latency_ms, 2) if latency_ms is not None else None,
+            "detail": detail,
+        }
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, timeout: float) -> List[dict]:
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[dict]):
+        if self._active and date.fromtimestamp(self._active[0]["ts"]) != date.fromtimestamp(
+            batch[0]["ts"]
+        ):
+            # Keep segments within one day so date queries prune well
+            self.rotate()
+        self._file.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in batch))
+        self._file.flush()
+        with self._lock:
+            self._active.extend(batch)
+        self.written += len(batch)
+        if len(self._active) >= self.segment_rows:
+            self.rotate()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._drain(self.flush_interval)
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} events: {str(e)}")
+        # Write whatever was queued before stopping
+        batch = self._drain(0.01)
+        while batch:
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} events: {str(e)}")
+            batch = self._drain(0.01)
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+            self._thread.start()
+
+    def rotate(self):
+        """Turn the active file into a compressed Parquet segment (writer thread only)."""
+        if not self._active:
+            return
+        with self._locked():
+            # Another process may have added segments since this one last looked
+            manifest = self._load_manifest()
+            with self._lock:
+                self._manifest = manifest
+            seq = self._next_seq()
+            rotating = self._path(f"segment-{seq:06d}.jsonl")
+            self._file.close()
+            os.replace(self._active_path, rotating)
+            self._file = self._open_active()
+            try:
+                self._convert(seq, rotating)
+            finally:
+                # If conversion failed the rows stay in the .jsonl and are retried on restart
+                with self._lock:
+                    self._active = []
+
+    def _convert(self, seq: int, rotating: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = self._read_jsonl(rotating)
+        name = f"segment-{seq:06d}.parquet"
+        if rows:
+            table = pa.Table.from_pylist(rows, schema=_schema())
+            temp = self._path(name + ".tmp")
+            pq.write_table(table, temp, compression="zstd", row_group_size=2000)
+            os.replace(temp, self._path(name))
+            entry = {"seq": seq, "file": name, **segment_stats(rows)}
+            with self._lock:
+                self._manifest = self._manifest + [entry]
+            self._save_manifest()
+            logger.info(f"Rotated {len(rows)} events into {name}")
+        os.remove(rotating)
+
+    def _recover_rotations(self):
+        # A crash between renaming the active file and removing it leaves a
+        # .jsonl segment. Called under the manifest lock, which every rotation
+        # holds, so none of these is still being converted.
+        for rotating in sorted(glob.glob(self._path("segment-*.jsonl"))):
+            seq = self._seq(rotating)
+            if any(entry["seq"] == seq for entry in self._manifest):
+                os.remove(rotating)
+                continue
+            try:
+                self._convert(seq, rotating)
+            except Exception as e:
+                # Kept for the next start rather than keeping the log from opening
+                logger.error(f"Failed to convert {rotating}: {str(e)}")
+
+    def _adopt_orphans(self):
+        # Active files of processes that exited; a live writer holds its own locked
+        for path in sorted(glob.glob(self._path(ACTIVE_PATTERN))):
+            if path == self._active_path:
+                continue
+            with open(path, "a", encoding="utf-8") as f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue
+                seq = self._next_seq()
+                rotating = self._path(f"segment-{seq:06d}.jsonl")
+                os.replace(path, rotating)
+            try:
+                self._convert(seq, rotating)
+            except Exception as e:
+                # Left as a .jsonl segment and retried on the next start
+                logger.error(f"Failed to rotate events left in {path}: {str(e)}")
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        recipient: Optional[str] = None,
+        status: Optional[str] = None,
+        kind: Optional[str] = None,
+        limit: int = 100,
+    ) -> dict:
+        """Newest matching events, reading only segments whose stats can match."""
+        import pyarrow.parquet as pq
+
+        self._refresh_manifest()
+        with self._lock:
+            manifest = list(self._manifest)
+            rows = [row for row in self._active if _matches(row, start, end, recipient, status, kind)]
+
+        filters = []
+        if start is not None:
+            filters.append(("ts", ">=", start))
+        if end is not None:
+            filters.append(("ts", "<", end))
+        if recipient is not None:
+            filters.append(("recipient", "=", recipient))
+        if status is not None:
+            filters.append(("status", "=", status))
+        if kind is not None:
+            filters.append(("kind", "=", kind))
+
+        scanned = pruned = 0
+        # Walk segments by newest event first and stop once ``limit`` events
+        # newer than the next segment have been found. Segment numbers are not
+        # in time order: several processes rotate, and a segment adopted from
+        # an exited worker can hold older events than the one before it.
+        by_newest = sorted(manifest, key=lambda entry: entry["ts_max"], reverse=True)
+        for position, entry in enumerate(by_newest):
+            if len(rows) >= limit:
+                rows.sort(key=lambda row: row["ts"], reverse=True)
+                if rows[limit - 1]["ts"] > entry["ts_max"]:
+                    pruned += len(manifest) - position
+                    break
+            if _prunable(entry, start, end, recipient, status, kind):
+                pruned += 1
+                continue
+            scanned += 1
+            table = pq.read_table(self._path(entry["file"]), filters=filters or None)
+            rows.extend(table.to_pylist())
+
+        self.segments_scanned += scanned
+        self.segments_pruned += pruned
+        rows.sort(key=lambda row: row["ts"], reverse=True)
+        return {
+            "events": [
+                {**row, "time": datetime.fromtimestamp(row["ts"]).astimezone().isoformat()}
+                for row in rows[:limit]
+            ],
+            "segments_scanned": scanned,
+            "segments_pruned": pruned,
+        }
+
+    def stats(self) -> Dict[str, object]:
+        self._refresh_manifest()
+        with self._lock:
+            manifest = list(self._manifest)
+            active = len(self._active)
+        return {
+            "segments": len(manifest),
+            "segment_events": sum(entry["rows"] for entry in manifest),
+            "active_events": active,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "segments_scanned": self.segments_scanned,
+            "segments_pruned": self.segments_pruned,
+        }
+
+    def close(self):
+        """Write out queued events and stop the writer."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        self._file.close()
@@ -0,0 +1,303 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from metrics import OPENAI_LATENCY, OPENAI_TOKENS, timed
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Answer budget per affirmation; a batch of n gets n times this
+TOKENS_PER_AFFIRMATION = 50
+
+# Leading "1.", "2)", "-" or "•" on each line of a batched answer
+_LIST_MARKER = re.compile(r"^\s*(?:\d+\s*[.):-]|[-*•])\s*")
+
+
+def batch_messages(messages: Sequence[Dict[str, str]], n: int) -> List[Dict[str, str]]:
+    """Ask for ``n`` distinct affirmations in one completion.
+
+    The system and user prompts are sent once per batch instead of once per
+    affirmation.
+    """
+    return [
+        *messages,
+        {
+            "role": "user",
+            "content": (
+                f"Write {n} distinct messages following the instructions above. "
+                "Return them as a numbered list, one message per line, with nothing else."
+            ),
+        },
+    ]
+
+
+def parse_batch(content: str) -> List[str]:
+    """Split a numbered-list answer into individual affirmations."""
+    affirmations = []
+    for line in content.splitlines():
+        line = _LIST_MARKER.sub("", line).strip().strip('"“”').strip()
+        if line:
+            affirmations.append(line)
+    return affirmations
+
+
+class TokenUsage:
+    """Prompt and completion tokens spent per generated affirmation.
+
+    Totals are also exported to ``counter`` unless it is ``None``.
+    """
+
+    def __init__(self, counter=OPENAI_TOKENS):
+        self.counter = counter
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.affirmations = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage, affirmations: int):
+        """Add one completion's usage (an API object or a Batch API dict)."""
+        if isinstance(usage, dict):
+            prompt = usage.get("prompt_tokens") or 0
+            completion = usage.get("completion_tokens") or 0
+        else:
+            prompt = getattr(usage, "prompt_tokens", 0) or 0
+            completion = getattr(usage, "completion_tokens", 0) or 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.affirmations += affirmations
+        if self.counter is not None:
+            self.counter.inc(prompt, kind="prompt")
+            self.counter.inc(completion, kind="completion")
+
+    def stats(self) -> dict:
+        with self._lock:
+            per = self.affirmations or None
+            return {
+                "calls": self.calls,
+                "affirmations": self.affirmations,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "prompt_tokens_per_affirmation": round(self.prompt_tokens / per, 1) if per else None,
+                "tokens_per_affirmation": (
+                    round((self.prompt_tokens + self.completion_tokens) / per, 1) if per else None
+                ),
+                "affirmations_per_call": round(self.affirmations / self.calls, 1) if self.calls else None,
+            }
+
+
+class AffirmationGenerator:
+    """Async OpenAI generation shared by the API endpoints.
+
+    Uses ``AsyncOpenAI`` so a slow completion only suspends the request that
+    is waiting on it instead of blocking the whole event loop. The clients
+    (and the ``openai`` package) are only loaded on first use.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._sync_client = None
+        self.model = os.getenv("OPENAI_MODEL", "gpt-4o")
+        self.max_tokens = TOKENS_PER_AFFIRMATION
+        self.temperature = 0.7
+        self.usage = TokenUsage()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    @property
+    def sync_client(self):
+        """Blocking client for scheduler threads."""
+        if self._sync_client is None:
+            from openai import OpenAI
+
+            self._sync_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._sync_client
+
+    @timed(OPENAI_LATENCY, "openai")
+    async def generate(self, messages: Sequence[Dict[str, str]], usage=None) -> str:
+        """Generate a single affirmation from the given chat messages.
+
+        ``usage`` is an extra ``TokenUsage``, e.g. a prompt variant's, that the
+        completion's tokens are also added to.
+        """
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+        )
+        self._record_usage(response.usage, 1, usage)
+        return response.choices[0].message.content.strip()
+
+    async def stream(self, messages: Sequence[Dict[str, str]], usage=None) -> AsyncIterator[str]:
+        """Yield a single affirmation's text deltas as OpenAI produces them."""
+        with timed(OPENAI_LATENCY, "openai"):
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in response:
+                # The final chunk has no choices, only the usage for the whole stream
+                if chunk.usage is not None:
+                    self._record_usage(chunk.usage, 1, usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    def _record_usage(self, response_usage, affirmations: int, usage=None):
+        self.usage.record(response_usage, affirmations)
+        if usage is not None:
+            usage.record(response_usage, affirmations)
+
+    def batch_request(self, messages: Sequence[Dict[str, str]], n: int) -> dict:
+        """Chat completion parameters for a batch of ``n`` affirmations."""
+        return {
+            "model": self.model,
+            "messages": batch_messages(messages, n),
+            "max_tokens": self.max_tokens * n,
+            "temperature": self.temperature,
+        }
+
+    def _parse_response(self, response, n: int, usage=None) -> List[str]:
+        affirmations = parse_batch(response.choices[0].message.content)[:n]
+        self._record_usage(response.usage, len(affirmations), usage)
+        if not affirmations:
+            raise ValueError("Empty batch in completion")
+        return affirmations
+
+    @timed(OPENAI_LATENCY, "openai")
+    async def generate_batch(
+        self, messages: Sequence[Dict[str, str]], n: int, usage=None
+    ) -> List[str]:
+        """Generate up to ``n`` distinct affirmations in a single completion."""
+        response = await self.client.chat.completions.create(**self.batch_request(messages, n))
+        return self._parse_response(response, n, usage)
+
+    @timed(OPENAI_LATENCY, "openai")
+    def generate_batch_sync(
+        self, messages: Sequence[Dict[str, str]], n: int, usage=None
+    ) -> List[str]:
+        """Blocking ``generate_batch`` for scheduler threads."""
+        response = self.sync_client.chat.completions.create(**self.batch_request(messages, n))
+        return self._parse_response(response, n, usage)
+
+    def write_batch_file(
+        self, path: str, messages: Sequence[Dict[str, str]], count: int, per_request: int
+    ) -> int:
+        """Write a Batch API input file asking for ``count`` affirmations; returns the request count."""
+        requests = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for start in range(0, count, per_request):
+                line = {
+                    "custom_id": f"affirmations-{start}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self.batch_request(messages, min(per_request, count - start)),
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+                requests += 1
+        return requests
+
+    def read_batch_output(self, lines) -> List[str]:
+        """Affirmations from Batch API output lines, recording their token usage."""
+        affirmations = []
+        for line in lines:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                logger.error(f"Batch request {result.get('custom_id')} failed: {result.get('error')}")
+                continue
+            body = response["body"]
+            batch = parse_batch(body["choices"][0]["message"]["content"])
+            self.usage.record(body.get("usage") or {}, len(batch))
+            affirmations.extend(batch)
+        return affirmations
+
+    async def close(self):
+        """Close the underlying HTTP connection pools."""
+        if self._client is not None:
+            await self._client.close()
+        if self._sync_client is not None:
+            self._sync_client.close()
+
+
+def _batch_cli(argv: Optional[List[str]] = None) -> Tuple[int, dict]:
+    parser = argparse.ArgumentParser(
+        description="Pre-generate affirmations with the OpenAI Batch API."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Write a batch input file and submit it")
+    submit.add_argument("--count", type=int, default=500)
+    submit.add_argument("--per-request", type=int, default=20)
+    submit.add_argument("--input", default="affirmation_batch.jsonl")
+    submit.add_argument("--dry-run", action="store_true", help="Only write the input file")
+
+    collect = commands.add_parser(
+        "collect", help="Append a finished batch's affirmations to a corpus file"
+    )
+    collect.add_argument("batch", help="Batch id, or a downloaded output .jsonl file")
+    collect.add_argument("output", help="Text file, one affirmation per line")
+
+    args = parser.parse_args(argv)
+    from prompts import AFFIRMATION_MESSAGES
+
+    generator = AffirmationGenerator()
+    client = generator.sync_client
+
+    if args.command == "submit":
+        requests = generator.write_batch_file(
+            args.input, AFFIRMATION_MESSAGES, args.count, args.per_request
+        )
+        logger.info(f"Wrote {requests} requests for {args.count} affirmations to {args.input}")
+        if args.dry_run:
+            return 0, {"input": args.input, "requests": requests}
+        with open(args.input, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return 0, {"batch_id": batch.id, "status": batch.status, "requests": requests}
+
+    if os.path.exists(args.batch):
+        with open(args.batch, encoding="utf-8") as f:
+            lines = f.readlines()
+    else:
+        batch = client.batches.retrieve(args.batch)
+        if batch.status != "completed" or not batch.output_file_id:
+            return 1, {"batch_id": batch.id, "status": batch.status}
+        lines = client.files.content(batch.output_file_id).text.splitlines()
+
+    affirmations = generator.read_batch_output(lines)
+    with open(args.output, "a", encoding="utf-8") as f:
+        for affirmation in affirmations:
+            f.write(affirmation + "\n")
+    return 0, {"collected": len(affirmations), "usage": generator.usage.stats()}
+
+
+if __name__ == "__main__":
+    code, result = _batch_cli()
+    print(json.dumps(result, indent=2))
+    sys.exit(code)
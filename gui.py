@@ -1,12 +1,20 @@
 import streamlit as st
 import requests
 import datetime
+import json
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urljoin
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 import time
 
+from resilience import backoff_delays
+
 MAX_RETRIES = 3
-RETRY_DELAY = 5  # seconds
+RETRY_BASE = 2  # seconds; doubled per retry with full jitter
+RETRY_CAP = 20
+TIMEOUT = (5, 40)  # connect, read
 
 load_dotenv()
 
@@ -109,50 +117,124 @@ st.markdown(
 # API_URL = os.getenv("AFFIRMATION_API_URL", "https://your-api.com/affirmation")
 
 API_URL = st.secrets["AFFIRMATION_API_URL"]
+# Optional: the API's /stream-affirmation, to show the text as it is generated
+STREAM_URL = st.secrets.get("AFFIRMATION_STREAM_URL")
+HEALTH_URL = urljoin(API_URL, "/health")
+
+
+class DailyFetch:
+    """Today's affirmation being fetched in the background.
+
+    ``partial`` holds the text received so far when streaming, so the page
+    can show it before the whole affirmation has arrived.
+    """
+
+    def __init__(self):
+        self.partial = ""
+        self.future: Future = None
+
+
+@st.cache_resource
+def http_session() -> requests.Session:
+    """One pooled HTTP session shared by every viewer."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def fetch_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="affirmation-fetch")
+
+
+def stream_affirmation(session: requests.Session, fetch: DailyFetch) -> str:
+    """Read server-sent events, keeping the text received so far in ``fetch``."""
+    event = None
+    with session.get(STREAM_URL, stream=True, timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:") :].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:") :])
+                if event == "delta":
+                    fetch.partial += data["text"]
+                elif event == "done":
+                    return data["affirmation"]
+                elif event == "error":
+                    raise RuntimeError(data.get("detail", "Stream failed"))
+    raise RuntimeError("Stream ended early")
+
+
+# Keyed by the date, so every viewer shares one affirmation until midnight
+@st.cache_data(ttl=datetime.timedelta(days=1), max_entries=2, show_spinner=False)
+def todays_affirmation(day: str, _fetch: DailyFetch) -> str:
+    """Fetch the day's affirmation, retrying with jittered backoff."""
+    session = http_session()
+    error = None
+    for delay in [0, *backoff_delays(MAX_RETRIES - 1, RETRY_BASE, RETRY_CAP)]:
+        time.sleep(delay)
+        try:
+            # Cheap ping first: a sleeping backend wakes up on it without
+            # spending the generation request's timeout on the cold start
+            session.get(HEALTH_URL, timeout=TIMEOUT).raise_for_status()
+            if STREAM_URL:
+                _fetch.partial = ""
+                return stream_affirmation(session, _fetch)
+            response = session.get(API_URL, timeout=TIMEOUT)
+            response.raise_for_status()
+            return response.json().get("affirmation", "You are loved and appreciated 💕")
+        except Exception as e:
+            error = e
+    raise error
+
+
+@st.cache_resource(ttl=datetime.timedelta(days=1), max_entries=2)
+def start_fetch(day: str) -> DailyFetch:
+    """Start fetching the day's affirmation once per process, off the script thread."""
+    fetch = DailyFetch()
+    fetch.future = fetch_executor().submit(todays_affirmation, day, fetch)
+    return fetch
+
+
+# Start fetching (and waking the backend) as soon as the page loads
+today = str(datetime.date.today())
+fetch = start_fetch(today)
+
+
+def show_affirmation():
+    if fetch.future.exception() is not None:
+        st.warning("⚠️ Ooops, I'm sorry I disappointed you. You can try again later.")
+        # Let the next click start a fresh attempt
+        start_fetch.clear()
+    else:
+        st.success(fetch.future.result())
+
+
+@st.fragment(run_every=1)
+def wait_for_affirmation():
+    """Re-run every second until the background fetch finishes."""
+    if fetch.future.done():
+        st.rerun()
+    elif fetch.partial:
+        st.success(fetch.partial)
+    else:
+        st.info("Waking up the server… hang tight 💕")
 
-# Store affirmation for the day
-if "today_affirmation" not in st.session_state or st.session_state["date"] != str(
-    datetime.date.today()
-):
-    st.session_state["today_affirmation"] = None
-    st.session_state["date"] = str(datetime.date.today())
 
 # Create 3 columns: left, center, right
 col1, col2, col3 = st.columns([1, 2, 1])
 
 with col2:  # Put button in the middle column
     if st.button("✨ Make me talk ✨"):
-        if not st.session_state["today_affirmation"]:
-            # Show loading message
-            loading_placeholder = st.empty()
-            loading_placeholder.info("Waking up the server… hang tight 💕")
-
-            success = False
-            for attempt in range(MAX_RETRIES):
-                try:
-                    response = requests.get(API_URL, timeout=40)
-                    if response.status_code == 200:
-                        data = response.json()
-                        st.session_state["today_affirmation"] = data.get(
-                            "affirmation", "You are loved and appreciated 💕"
-                        )
-                        success = True
-                        break
-                    else:
-                        if attempt == MAX_RETRIES - 1:  # Last attempt
-                            st.session_state["today_affirmation"] = (
-                                "⚠️ Ooops, I'm sorry I disappointed you. You can try again later."
-                            )
-                except Exception as e:
-                    if attempt == MAX_RETRIES - 1:  # Last attempt
-                        st.session_state["today_affirmation"] = f"Error: {e}"
-                    else:
-                        time.sleep(RETRY_DELAY)  # wait then retry
-
-            # Clear loading message
-            loading_placeholder.empty()
+        st.session_state["revealed"] = today
 
 
 # Display affirmation
-if st.session_state["today_affirmation"]:
-    st.success(st.session_state["today_affirmation"])
+if st.session_state.get("revealed") == today:
+    if fetch.future.done():
+        show_affirmation()
+    else:
+        wait_for_affirmation()
@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import zlib
+from array import array
+from datetime import datetime
+from typing import Awaitable, Callable, Optional, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Mersenne prime used for the MinHash permutations
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class AffirmationHistory:
+    """SQLite record of sent affirmations with a MinHash near-duplicate index.
+
+    Every affirmation is reduced to a MinHash signature over character
+    shingles. Signatures are split into bands and kept in an in-memory LSH
+    index, so a lookup only compares against the few past affirmations that
+    share a band instead of scanning the whole history.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: Optional[float] = None,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 4,
+    ):
+        self.path = path or os.getenv("HISTORY_DB", "affirmation_history.db")
+        self.threshold = threshold or float(os.getenv("HISTORY_SIMILARITY", "0.5"))
+        self.max_regenerations = int(os.getenv("HISTORY_MAX_REGENERATIONS", "3"))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(1)
+        self._perms = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)
+        ]
+
+        self._lock = threading.Lock()
+        self._index = {}  # (band, band hash) -> [row ids]
+        self._signatures = {}  # row id -> signature
+        self._texts = {}  # row id -> affirmation
+        self.duplicates_found = 0
+        # Called with each near-duplicate that is thrown away and regenerated
+        self.on_regenerate = None
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sent_affirmations (
+                id INTEGER PRIMARY KEY,
+                affirmation TEXT NOT NULL,
+                recipient TEXT,
+                sent_at TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+        self._load_index()
+
+    def _load_index(self):
+        rows = self.conn.execute(
+            "SELECT id, affirmation, signature FROM sent_affirmations"
+        ).fetchall()
+        for row_id, affirmation, blob in rows:
+            signature = array("I")
+            signature.frombytes(blob)
+            self._add_to_index(row_id, affirmation, tuple(signature))
+        logger.info(f"Loaded {len(rows)} affirmations into the history index")
+
+    def _shingles(self, text: str):
+        normalized = " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+        if len(normalized) <= self.shingle_size:
+            return {normalized}
+        k = self.shingle_size
+        return {normalized[i : i + k] for i in range(len(normalized) - k + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        """MinHash signature of the text's character shingles."""
+        hashes = [zlib.crc32(s.encode()) for s in self._shingles(text)]
+        return tuple(
+            min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH for a, b in self._perms
+        )
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, hash(signature[start : start + self.rows])
+
+    def _add_to_index(self, row_id: int, affirmation: str, signature):
+        self._signatures[row_id] = signature
+        self._texts[row_id] = affirmation
+        for key in self._band_keys(signature):
+            self._index.setdefault(key, []).append(row_id)
+
+    def find_similar(
+        self, text: str, signature=None
+    ) -> Optional[Tuple[str, float]]:
+        """Most similar past affirmation at or above the threshold, if any."""
+        signature = signature or self.signature(text)
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._index.get(key, ()))
+
+            best = None
+            for row_id in candidates:
+                past = self._signatures[row_id]
+                similarity = sum(x == y for x, y in zip(signature, past)) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (self._texts[row_id], similarity)
+        return best
+
+    def is_duplicate(self, text: str) -> bool:
+        """Whether the text is too similar to something already sent."""
+        match = self.find_similar(text)
+        if match:
+            self.duplicates_found += 1
+            logger.info(
+                f"Affirmation is {match[1]:.0%} similar to one already sent: {match[0]}"
+            )
+        return match is not None
+
+    def _regenerating(self, affirmation: str):
+        logger.info("Regenerating near-duplicate affirmation...")
+        if self.on_regenerate:
+            try:
+                self.on_regenerate(affirmation)
+            except Exception as e:
+                logger.error(f"Error recording regeneration: {str(e)}")
+
+    def unique_affirmation(self, generate: Callable[[], str]) -> str:
+        """Call ``generate`` until it returns something not sent before."""
+        for _ in range(self.max_regenerations):
+            affirmation = generate()
+            if not self.is_duplicate(affirmation):
+                return affirmation
+            self._regenerating(affirmation)
+        return generate()
+
+    async def unique_affirmation_async(
+        self, generate: Callable[[], Awaitable[str]]
+    ) -> str:
+        """Coroutine version of ``unique_affirmation``."""
+        for _ in range(self.max_regenerations):
+            affirmation = await generate()
+            if not self.is_duplicate(affirmation):
+                return affirmation
+            self._regenerating(affirmation)
+        return await generate()
+
+    def record(
+        self,
+        affirmation: str,
+        recipient: Optional[str] = None,
+        sent_at: Optional[str] = None,
+    ) -> int:
+        """Store a sent affirmation and add it to the index."""
+        signature = self.signature(affirmation)
+        sent_at = sent_at or datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO sent_affirmations (affirmation, recipient, sent_at, signature) "
+                "VALUES (?, ?, ?, ?)",
+                (affirmation, recipient, sent_at, array("I", signature).tobytes()),
+            )
+            self.conn.commit()
+            self._add_to_index(cursor.lastrowid, affirmation, signature)
+            return cursor.lastrowid
+
+    def get(self, row_id: int) -> Optional[str]:
+        """A recorded affirmation by id, or ``None``."""
+        with self._lock:
+            return self._texts.get(row_id)
+
+    def import_jsonl(self, path: str) -> int:
+        """Bulk import a JSON-lines log (UTF-8 or UTF-16) in one transaction.
+
+        Each line is an object; the text is taken from ``affirmation``,
+        ``text``, ``message`` or ``body`` and the time from ``sent_at``,
+        ``timestamp`` or ``date``.
+        """
+        with open(path, "rb") as f:
+            raw = f.read()
+        encoding = "utf-16" if raw[:2] in (b"\xff\xfe", b"\xfe\xff") else "utf-8-sig"
+
+        entries = []
+        for line in raw.decode(encoding).splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed line: {line[:80]}")
+                continue
+
+            text = next(
+                (record[k] for k in ("affirmation", "text", "message", "body") if record.get(k)),
+                None,
+            )
+            if not text:
+                continue
+            sent_at = next(
+                (record[k] for k in ("sent_at", "timestamp", "date") if record.get(k)),
+                datetime.now().isoformat(timespec="seconds"),
+            )
+            entries.append(
+                (text.strip(), record.get("recipient"), str(sent_at), self.signature(text))
+            )
+
+        with self._lock:
+            with self.conn:
+                for text, recipient, sent_at, signature in entries:
+                    cursor = self.conn.execute(
+                        "INSERT INTO sent_affirmations (affirmation, recipient, sent_at, signature) "
+                        "VALUES (?, ?, ?, ?)",
+                        (text, recipient, sent_at, array("I", signature).tobytes()),
+                    )
+                    self._add_to_index(cursor.lastrowid, text, signature)
+
+        logger.info(f"Imported {len(entries)} affirmations from {path}")
+        return len(entries)
+
+    def stats(self) -> dict:
+        """Size of the history and how many near-duplicates were caught."""
+        with self._lock:
+            return {
+                "affirmations": len(self._signatures),
+                "index_buckets": len(self._index),
+                "threshold": self.threshold,
+                "duplicates_found": self.duplicates_found,
+            }
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the affirmation history store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Bulk import a JSON-lines log")
+    import_parser.add_argument("path")
+    args = parser.parse_args()
+
+    history = AffirmationHistory()
+    if args.command == "import":
+        print(f"Imported {history.import_jsonl(args.path)} affirmations")
+    history.close()
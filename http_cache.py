@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def seconds_until_midnight(now: Optional[datetime] = None) -> int:
+    """Seconds left in the server's local day."""
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def make_etag(body: bytes, suffix: str = "") -> str:
+    """Strong ETag for a representation's exact bytes."""
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return f'"{digest}{suffix}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already covers ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so ignore any W/ prefix
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def _accepts(request: Request, coding: str) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != coding:
+            continue
+        params = params.replace(" ", "").lower()
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def cached_response(
+    request: Request,
+    body: bytes,
+    media_type: str,
+    cache_control: str,
+    etag: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Full response, or an empty 304 if the client already has these bytes."""
+    headers = {"ETag": etag or make_etag(body), "Cache-Control": cache_control, **(headers or {})}
+    if not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+class StaticAsset:
+    """A file held in memory with pre-compressed variants and strong ETags.
+
+    The file is read and compressed once, on first request; each encoding
+    has its own ETag since the bytes differ. Clients revalidate with
+    If-None-Match and get a bodiless 304 while the file is unchanged.
+    """
+
+    def __init__(self, path: str, media_type: str, cache_control: str = "no-cache"):
+        self.path = path
+        self.media_type = media_type
+        self.cache_control = cache_control
+        # encoding ("identity", "gzip", "br") -> (body, etag)
+        self._variants: Optional[Dict[str, Tuple[bytes, str]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Tuple[bytes, str]]:
+        with open(self.path, "rb") as f:
+            body = f.read()
+        variants = {"identity": (body, make_etag(body))}
+        variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), make_etag(body, "-gzip"))
+        if brotli is not None:
+            variants["br"] = (brotli.compress(body), make_etag(body, "-br"))
+        logger.info(
+            f"Cached {self.path}: "
+            + ", ".join(f"{name} {len(data)} bytes" for name, (data, _) in variants.items())
+        )
+        return variants
+
+    @property
+    def variants(self) -> Dict[str, Tuple[bytes, str]]:
+        if self._variants is None:
+            with self._lock:
+                if self._variants is None:
+                    self._variants = self._load()
+        return self._variants
+
+    def response(self, request: Request) -> Response:
+        variants = self.variants
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in variants and _accepts(request, candidate):
+                encoding = candidate
+                break
+        body, etag = variants[encoding]
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return cached_response(
+            request, body, self.media_type, self.cache_control, etag, headers
+        )
+
+
+def daily_json_response(request: Request, payload: dict) -> Response:
+    """JSON that stays valid for the rest of the local day.
+
+    Shared caches and browsers may reuse it until midnight; after that the
+    ETag changes with the new day's content.
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    max_age = seconds_until_midnight()
+    return cached_response(
+        request,
+        body,
+        "application/json",
+        f"public, max-age={max_age}",
+        headers={
+            "Expires": format_datetime(
+                datetime.now(timezone.utc) + timedelta(seconds=max_age), usegmt=True
+            )
+        },
+    )
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+
+
+class IdempotencyConflict(RuntimeError):
+    """Another request with the same key is still being processed."""
+
+
+class IdempotencyStore:
+    """Idempotency keys and the results they produced, with TTL eviction.
+
+    A request first reserves its key. Only the request that reserved it does
+    the work and then stores its result; repeats get that stored result back.
+    Reservations left behind by a crash expire after ``pending_timeout``.
+    The SQLite file is shared by every worker process.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        pending_timeout: Optional[float] = None,
+    ):
+        self.path = path or os.getenv("IDEMPOTENCY_DB", "idempotency.db")
+        self.ttl = ttl or float(os.getenv("IDEMPOTENCY_TTL", str(2 * 24 * 3600)))
+        self.pending_timeout = pending_timeout or float(
+            os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "120")
+        )
+
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.replays = 0
+        self.conflicts = 0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                result TEXT,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    def _purge(self, now: float):
+        # Evict expired keys at most once a minute
+        if now - self._purged_at >= 60:
+            self._purged_at = now
+            self.conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+
+    def begin(self, key: str) -> Optional[dict]:
+        """Reserve ``key``; returns ``None`` if reserved, else the stored result.
+
+        Raises ``IdempotencyConflict`` while another request holds the key.
+        """
+        with self._lock:
+            row = self._reserve([key])[key]
+        if row is None:
+            return None
+        status, result = row
+        if status == PENDING:
+            self.conflicts += 1
+            raise IdempotencyConflict(f"Request {key} is already in progress")
+        self.replays += 1
+        return json.loads(result)
+
+    def begin_many(self, keys: Iterable[str]) -> List[str]:
+        """Reserve several keys in one transaction; returns those newly reserved."""
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            rows = self._reserve(keys)
+        reserved = [key for key in keys if rows[key] is None]
+        self.replays += len(keys) - len(reserved)
+        return reserved
+
+    def _reserve(self, keys: List[str]) -> Dict[str, Optional[tuple]]:
+        now = time.time()
+        existing = {}
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._purge(now)
+            for key in keys:
+                row = self.conn.execute(
+                    "SELECT status, result FROM idempotency_keys "
+                    "WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO idempotency_keys (key, status, result, expires_at) "
+                        "VALUES (?, ?, NULL, ?)",
+                        (key, PENDING, now + self.pending_timeout),
+                    )
+                existing[key] = row
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return existing
+
+    def complete(self, key: str, result: dict):
+        """Store the result for a reserved key; it is replayed until the TTL expires."""
+        self.complete_many({key: result})
+
+    def complete_many(self, results: Dict[str, dict]):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE idempotency_keys SET status = ?, result = ?, expires_at = ? WHERE key = ?",
+                [
+                    (DONE, json.dumps(result), expires_at, key)
+                    for key, result in results.items()
+                ],
+            )
+
+    def release(self, *keys: str):
+        """Drop reservations after a failure so a retry can do the work."""
+        with self._lock:
+            self.conn.executemany(
+                "DELETE FROM idempotency_keys WHERE key = ? AND status = ?",
+                [(key, PENDING) for key in keys],
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (keys,) = self.conn.execute(
+                "SELECT COUNT(*) FROM idempotency_keys WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return {
+            "keys": keys,
+            "ttl_s": self.ttl,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
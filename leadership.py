@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SQLiteLease:
+    """Named, time-limited lease in a SQLite file shared by local processes.
+
+    Whoever holds an unexpired lease may renew it; anyone may take it over
+    once it has expired. Every check-and-set runs in one ``BEGIN IMMEDIATE``
+    transaction, so two processes can never both hold it.
+    """
+
+    def __init__(self, name: str, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.name = name
+        self.path = path or os.getenv("LEADER_DB", "leader.db")
+        self.ttl = ttl or float(os.getenv("LEADER_LEASE_TTL", "30"))
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=self.ttl / 3
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    def acquire(self) -> bool:
+        """Take or renew the lease; returns whether this process holds it."""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)
+                ).fetchone()
+                held = row is None or row[0] == self.holder or row[1] <= now
+                if held:
+                    self.conn.execute(
+                        "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, "
+                        "expires_at = excluded.expires_at",
+                        (self.name, self.holder, now + self.ttl),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return held
+
+    def release(self):
+        """Give the lease up early so another process can take over at once."""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder)
+            )
+
+    def current(self) -> Optional[dict]:
+        """Current holder and seconds until the lease expires."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)
+            ).fetchone()
+        if not row or row[1] <= time.time():
+            return None
+        return {"holder": row[0], "expires_in_s": round(row[1] - time.time(), 1)}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class LeaderElection:
+    """Keeps renewing a lease and reports when this process gains or loses it.
+
+    Runs as a task on the application's event loop, so ``on_elected`` and
+    ``on_lost`` are called on the loop. Renewal happens well inside the
+    lease TTL; if the leader dies, a follower takes over once it expires.
+    """
+
+    def __init__(self, lease: SQLiteLease, renew_interval: Optional[float] = None):
+        self.lease = lease
+        self.renew_interval = renew_interval or float(
+            os.getenv("LEADER_RENEW_INTERVAL", str(lease.ttl / 3))
+        )
+        self.is_leader = False
+        self.on_elected: Optional[Callable[[], None]] = None
+        self.on_lost: Optional[Callable[[], None]] = None
+        self.elections = 0
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _set_leader(self, is_leader: bool):
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        if is_leader:
+            self.elections += 1
+            logger.info(f"Acquired {self.lease.name} leadership as {self.lease.holder}")
+        else:
+            logger.warning(f"Lost {self.lease.name} leadership")
+
+        callback = self.on_elected if is_leader else self.on_lost
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error handling leadership change: {str(e)}")
+
+    async def run(self):
+        while True:
+            try:
+                started = time.time()
+                held = await asyncio.to_thread(self.lease.acquire)
+                if held:
+                    self._valid_until = started + self.lease.ttl
+            except Exception as e:
+                # Without a confirmed renewal we can't assume we still lead
+                logger.error(f"Failed to renew {self.lease.name} lease: {str(e)}")
+                held = False
+            self._set_leader(held)
+            await asyncio.sleep(self.renew_interval)
+
+    def holds_lease(self) -> bool:
+        """Whether this process leads and its last renewal has not yet expired.
+
+        Checked right before leader-only work, so a process whose renewals
+        stalled stops acting as leader before anyone else can take over.
+        """
+        return self.is_leader and time.time() < self._valid_until
+
+    def start(self):
+        """Start campaigning; must be called from the event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Step down and hand the lease over immediately."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                await asyncio.to_thread(self.lease.release)
+            except Exception as e:
+                logger.error(f"Failed to release {self.lease.name} lease: {str(e)}")
+        self.lease.close()
+
+    def status(self) -> dict:
+        return {
+            "is_leader": self.is_leader,
+            "holder": self.lease.holder,
+            "leader": self.lease.current(),
+            "elections": self.elections,
+        }
+
+
+class SQLiteScheduleStore:
+    """Daily-send settings and recipient delivery times shared by local processes.
+
+    Kept in the lease database, so a schedule change made through any worker
+    reaches whichever one leads now or later. Every write bumps a version
+    that the workers poll to notice changes cheaply, and is appended to a
+    short change log so they can apply just what changed since their
+    version instead of reloading every recipient.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_changes: Optional[int] = None):
+        self.path = path or os.getenv("LEADER_DB", "leader.db")
+        # A worker further behind than this reloads everything instead
+        self.max_changes = max_changes or int(os.getenv("SCHEDULE_CHANGE_LOG", "1000"))
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=10
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS schedule_settings (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                enabled INTEGER,
+                hour INTEGER NOT NULL,
+                minute INTEGER NOT NULL,
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO schedule_settings VALUES (1, NULL, 6, 0, 0);
+            CREATE TABLE IF NOT EXISTS schedule_recipients (
+                recipient TEXT PRIMARY KEY,
+                hour INTEGER,
+                minute INTEGER,
+                timezone TEXT,
+                active INTEGER NOT NULL
+            );
+            -- State after each write: a recipient's row, or the settings
+            -- (enabled in active) when recipient is NULL
+            CREATE TABLE IF NOT EXISTS schedule_changes (
+                version INTEGER PRIMARY KEY,
+                recipient TEXT,
+                hour INTEGER,
+                minute INTEGER,
+                timezone TEXT,
+                active INTEGER
+            );
+            """
+        )
+
+    def _write(self, sql: str, params: tuple, recipient: Optional[str] = None):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(sql, params)
+                self.conn.execute("UPDATE schedule_settings SET version = version + 1")
+                version = self.conn.execute("SELECT version FROM schedule_settings").fetchone()[0]
+                if recipient is None:
+                    self.conn.execute(
+                        "INSERT INTO schedule_changes (version, hour, minute, active) "
+                        "SELECT version, hour, minute, enabled FROM schedule_settings"
+                    )
+                else:
+                    self.conn.execute(
+                        "INSERT INTO schedule_changes "
+                        "SELECT ?, recipient, hour, minute, timezone, active "
+                        "FROM schedule_recipients WHERE recipient = ?",
+                        (version, recipient),
+                    )
+                self.conn.execute(
+                    "DELETE FROM schedule_changes WHERE version <= ?",
+                    (version - self.max_changes,),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def set_daily(self, enabled: bool, hour: Optional[int] = None, minute: Optional[int] = None):
+        """Enable or disable the daily jobs, optionally moving the default time."""
+        if hour is None:
+            self._write("UPDATE schedule_settings SET enabled = ?", (int(enabled),))
+        else:
+            self._write(
+                "UPDATE schedule_settings SET enabled = ?, hour = ?, minute = ?",
+                (int(enabled), hour, minute or 0),
+            )
+
+    def set_recipient(
+        self,
+        recipient: str,
+        hour: Optional[int] = None,
+        minute: Optional[int] = None,
+        timezone: Optional[str] = None,
+    ):
+        """Save a recipient's delivery time; no hour means the default time."""
+        self._write(
+            "INSERT INTO schedule_recipients (recipient, hour, minute, timezone, active) "
+            "VALUES (?, ?, ?, ?, 1) ON CONFLICT(recipient) DO UPDATE SET "
+            "hour = excluded.hour, minute = excluded.minute, "
+            "timezone = excluded.timezone, active = 1",
+            (recipient, hour, minute, timezone),
+            recipient,
+        )
+
+    def remove_recipient(self, recipient: str):
+        """Stop daily emails to a recipient, including one from the configuration."""
+        self._write(
+            "INSERT INTO schedule_recipients (recipient, active) VALUES (?, 0) "
+            "ON CONFLICT(recipient) DO UPDATE SET active = 0",
+            (recipient,),
+            recipient,
+        )
+
+    def version(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT version FROM schedule_settings").fetchone()[0]
+
+    def changes(self, since: int) -> Optional[List[dict]]:
+        """Changes after version ``since``, oldest first.
+
+        Each is ``{"version", "recipient", "slot"}`` for a recipient, with
+        ``slot`` as in ``load``, or ``{"version", "enabled", "default_time"}``
+        for the settings. Returns ``None`` if the log no longer reaches back
+        to ``since``, in which case the caller must ``load`` everything.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                version = self.conn.execute(
+                    "SELECT version FROM schedule_settings"
+                ).fetchone()[0]
+                rows = self.conn.execute(
+                    "SELECT version, recipient, hour, minute, timezone, active "
+                    "FROM schedule_changes WHERE version > ? ORDER BY version",
+                    (since,),
+                ).fetchall()
+            finally:
+                self.conn.execute("COMMIT")
+        if version == since:
+            return []
+        if not rows or rows[0][0] != since + 1 or rows[-1][0] != version:
+            return None
+        changes = []
+        for version, recipient, hour, minute, timezone, active in rows:
+            if recipient is None:
+                changes.append(
+                    {
+                        "version": version,
+                        "enabled": None if active is None else bool(active),
+                        "default_time": (hour, minute),
+                    }
+                )
+            else:
+                changes.append(
+                    {
+                        "version": version,
+                        "recipient": recipient,
+                        "slot": (hour, minute, timezone) if active else None,
+                    }
+                )
+        return changes
+
+    def load(self) -> dict:
+        """Settings and recipient overrides as of one consistent snapshot.
+
+        ``enabled`` is ``None`` until a process first saves the settings.
+        ``recipients`` maps each saved recipient to ``(hour, minute, timezone)``,
+        or to ``None`` once removed.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                enabled, hour, minute, version = self.conn.execute(
+                    "SELECT enabled, hour, minute, version FROM schedule_settings"
+                ).fetchone()
+                rows = self.conn.execute(
+                    "SELECT recipient, hour, minute, timezone, active "
+                    "FROM schedule_recipients ORDER BY rowid"
+                ).fetchall()
+            finally:
+                self.conn.execute("COMMIT")
+        return {
+            "version": version,
+            "enabled": None if enabled is None else bool(enabled),
+            "default_time": (hour, minute),
+            "recipients": {
+                recipient: (hour, minute, timezone) if active else None
+                for recipient, hour, minute, timezone, active in rows
+            },
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -1,11 +1,18 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse
-from openai import OpenAI
-import os
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import HTTPConnection, Request
+import asyncio
+import json
 import logging
+from datetime import date
+from typing import Optional
 from dotenv import load_dotenv
-from email_service import EmailService
-from scheduler import AffirmationScheduler
+from delivery_index import DeliveryIndex
+from event_log import parse_time
+from http_cache import daily_json_response
+from metrics import CONTENT_TYPE, REGISTRY
+from services import Services
 
 load_dotenv()
 
@@ -13,14 +20,34 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-email_service = EmailService()
-scheduler = AffirmationScheduler()
+# Built lazily: importing this module constructs no clients or connections
+services = Services()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services once the server is up and stop them on exit."""
+    # Warm up in the background so the first requests (and /health) are
+    # answered while clients and schedulers are still being built
+    warmup = asyncio.create_task(services.start())
+    yield
+    if not warmup.done():
+        warmup.cancel()
+        await asyncio.gather(warmup, return_exceptions=True)
+    await services.stop()
+
 
 app = FastAPI(
     title="Daily Affirmations API",
     description="API for generating and sending daily affirmations",
+    lifespan=lifespan,
 )
+app.state.services = services
+
+
+def get_services(connection: HTTPConnection) -> Services:
+    """Shared services for HTTP and WebSocket endpoints."""
+    return connection.app.state.services
 
 
 # @app.get("/")
@@ -29,9 +56,9 @@ app = FastAPI(
 
 
 @app.get("/")
-async def admin_dashboard():
-    """Serve the admin dashboard."""
-    return FileResponse("admin_dashboard.html")
+async def admin_dashboard(request: Request, services: Services = Depends(get_services)):
+    """Serve the admin dashboard from memory, or 304 if the client's copy is current."""
+    return services.dashboard.response(request)
 
 
 @app.get("/health")
@@ -40,92 +67,135 @@ async def health():
 
 
 @app.get("/get-affirmation")
-async def get_affirmation():
+async def get_affirmation(services: Services = Depends(get_services)):
     """Generate a daily affirmation."""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are PB — authentic, sharp, never corny. "
-                        "Your affirmations for your girlfriend are deep, original, and well-worded, "
-                        "with richer vocabulary and poetic charm. "
-                        "Avoid clichés, keep it personal, captivating, and real."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "Generate one short message for my girlfriend — it can be an affirmation, compliment, reassurance, gratitude, flirty line, or poetic note. "
-                        "Make it deep, original, vocabulary-rich, slightly poetic but natural. "
-                        "Avoid corny or generic phrasing; it should feel authentic, charming, and real, and saying 'in the quiet tapestry of our lives'."
-                    ),
-                },
-            ],
-            max_tokens=50,
-            temperature=0.7,
+        affirmation = await services.affirmation_flight.do(
+            "get-affirmation", services.generate_affirmation
         )
-        affirmation = response.choices[0].message.content.strip()
         return {"affirmation": affirmation}
     except Exception as e:
         logger.error(f"Error generating affirmation: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to generate affirmation")
 
 
-@app.post("/send-email")
-async def send_affirmation_email():
-    """Send a daily affirmation email immediately."""
+@app.get("/daily-affirmation")
+async def get_daily_affirmation(
+    request: Request, services: Services = Depends(get_services)
+):
+    """Today's affirmation, the same for every caller until local midnight."""
     try:
-        # Generate affirmation
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are PB — authentic, sharp, never corny. "
-                        "Your affirmations for your girlfriend are deep, original, and well-worded, "
-                        "with richer vocabulary and poetic charm. "
-                        "Avoid clichés, keep it personal, captivating, and real."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "Generate one short message for my girlfriend — it can be an affirmation, compliment, reassurance, gratitude, flirty line, or poetic note. "
-                        "Make it deep, original, vocabulary-rich, slightly poetic but natural. "
-                        "Avoid corny or generic phrasing; it should feel authentic, charming, and real, and saying 'in the quiet tapestry..'."
-                    ),
-                },
-            ],
-            max_tokens=50,
-            temperature=0.7,
+        affirmation = await services.daily_affirmation_flight.do(
+            "daily-affirmation", services.generate_affirmation
         )
-        affirmation = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error generating daily affirmation: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to generate affirmation")
+    return daily_json_response(request, {"affirmation": affirmation})
 
-        # Send email
-        success = email_service.send_affirmation_email(affirmation)
 
-        if success:
-            return {"message": "Email sent successfully", "affirmation": affirmation}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to send email")
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
+@app.get("/stream-affirmation")
+async def stream_affirmation(services: Services = Depends(get_services)):
+    """Stream an affirmation as server-sent events while it is generated.
+
+    Sends ``delta`` events with text fragments and a final ``done`` event
+    with the full affirmation and its history id.
+    """
+
+    async def events():
+        try:
+            async for event, data in services.stream_affirmation():
+                yield _sse(event, {"text": data} if event == "delta" else data)
+        except Exception as e:
+            logger.error(f"Error streaming affirmation: {str(e)}")
+            yield _sse("error", {"detail": "Failed to generate affirmation"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/send-email")
+async def send_affirmation_email(
+    history_id: Optional[int] = None,
+    idempotency_key: Optional[str] = None,
+    idempotency_key_header: Optional[str] = Header(None, alias="Idempotency-Key"),
+    services: Services = Depends(get_services),
+):
+    """Queue a daily affirmation email for immediate delivery.
+
+    ``history_id`` sends an affirmation already shown, e.g. by
+    ``/stream-affirmation``, instead of generating a new one. Repeats with
+    the same idempotency key (the ``Idempotency-Key`` header or query
+    parameter, by default the recipient and today's date) return the first
+    result without sending again.
+    """
+    # Imported here: idempotency pulls in sqlite3, which /health never needs
+    from idempotency import IdempotencyConflict
+
+    email_service, history = services.email_service, services.history
+    if history_id is not None and history.get(history_id) is None:
+        raise HTTPException(status_code=404, detail="Affirmation not found")
+    recipient = email_service.recipient_email
+    key = idempotency_key_header or idempotency_key
+    if not key:
+        key = f"send-email:{recipient}:{date.today().isoformat()}"
+        if history_id is not None:
+            key += f":{history_id}"
+    try:
+        if not recipient:
+            raise RuntimeError("No recipient configured")
+        return await services.send_email_once(key, recipient, history_id)
+
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error sending email: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to send email")
 
 
+@app.get("/outbox/{message_id}")
+async def get_outbox_message(
+    message_id: int, services: Services = Depends(get_services)
+):
+    """Get the delivery status of a queued email."""
+    message = await asyncio.to_thread(services.outbox.get, message_id)
+    if message is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return message
+
+
+@app.get("/outbox-status")
+async def get_outbox_status(services: Services = Depends(get_services)):
+    """Get the number of queued, sent and dead-lettered emails."""
+    return await asyncio.to_thread(services.outbox.stats)
+
+
 @app.post("/start-scheduler")
-async def start_daily_scheduler(hour: int = 9, minute: int = 0):
+async def start_daily_scheduler(
+    hour: int = 9, minute: int = 0, services: Services = Depends(get_services)
+):
     """Start the daily email scheduler."""
     try:
+        scheduler = services.scheduler
         scheduler.start_scheduler(hour, minute)
         next_run = scheduler.get_next_run_time()
+        if scheduler.leader is not None and not scheduler.leader.is_leader:
+            # The setting is shared; the leader worker schedules the sends
+            message = (
+                f"Daily scheduler enabled for {hour:02d}:{minute:02d}. "
+                "Emails will be sent by the worker holding scheduler leadership."
+            )
+        else:
+            message = f"Daily scheduler started. Emails will be sent at {hour:02d}:{minute:02d} daily."
         return {
-            "message": f"Daily scheduler started. Emails will be sent at {hour:02d}:{minute:02d} daily.",
+            "message": message,
             "next_run_time": next_run.isoformat() if next_run else None,
         }
     except Exception as e:
@@ -133,11 +203,43 @@ async def start_daily_scheduler(hour: int = 9, minute: int = 0):
         raise HTTPException(status_code=500, detail="Failed to start scheduler")
 
 
+@app.put("/recipients/{email}/schedule")
+async def schedule_recipient(
+    email: str,
+    hour: Optional[int] = None,
+    minute: int = 0,
+    timezone: Optional[str] = None,
+    services: Services = Depends(get_services),
+):
+    """Add a recipient or move them to their own delivery time and timezone."""
+    scheduler = services.scheduler
+    try:
+        await asyncio.to_thread(scheduler.schedule_recipient, email, hour, minute, timezone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    bucket = scheduler.delivery_index.slot(email)
+    return {"recipient": email, "bucket": DeliveryIndex.label(bucket)}
+
+
+@app.delete("/recipients/{email}/schedule")
+async def unschedule_recipient(email: str, services: Services = Depends(get_services)):
+    """Stop daily emails to a recipient."""
+    if not await asyncio.to_thread(services.scheduler.unschedule_recipient, email):
+        raise HTTPException(status_code=404, detail="Recipient not found")
+    return {"message": f"Daily emails to {email} stopped"}
+
+
+@app.get("/delivery-buckets")
+async def get_delivery_buckets(services: Services = Depends(get_services)):
+    """Get the occupied delivery buckets and when each next fires."""
+    return services.scheduler.bucket_status()
+
+
 @app.post("/stop-scheduler")
-async def stop_daily_scheduler():
+async def stop_daily_scheduler(services: Services = Depends(get_services)):
     """Stop the daily email scheduler."""
     try:
-        scheduler.stop_scheduler()
+        await asyncio.to_thread(services.scheduler.stop_daily_job)
         return {"message": "Daily scheduler stopped"}
     except Exception as e:
         logger.error(f"Error stopping scheduler: {str(e)}")
@@ -145,64 +247,147 @@ async def stop_daily_scheduler():
 
 
 @app.get("/scheduler-status")
-async def get_scheduler_status():
+async def get_scheduler_status(services: Services = Depends(get_services)):
     """Get the current status of the scheduler."""
     try:
-        next_run = scheduler.get_next_run_time()
-        return {
-            "scheduler_running": scheduler.scheduler.running,
-            "next_run_time": next_run.isoformat() if next_run else None,
-        }
+        return await asyncio.to_thread(services.build_status)
     except Exception as e:
         logger.error(f"Error getting scheduler status: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get scheduler status")
 
 
+@app.websocket("/ws/status")
+async def status_stream(
+    websocket: WebSocket, services: Services = Depends(get_services)
+):
+    """Push scheduler status to the dashboard whenever it changes."""
+    status_broadcaster = services.status_broadcaster
+    await websocket.accept()
+    queue = status_broadcaster.subscribe()
+    # Keep a pending receive so a disconnect is noticed even when nothing changes
+    receiver = asyncio.ensure_future(websocket.receive_text())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, receiver}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                await websocket.send_text(getter.result())
+            else:
+                getter.cancel()
+            if receiver in done:
+                receiver.result()  # raises WebSocketDisconnect once the client is gone
+                receiver = asyncio.ensure_future(websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        status_broadcaster.unsubscribe(queue)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Latency histograms and failure counters in Prometheus text format."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/token-usage")
+async def get_token_usage(services: Services = Depends(get_services)):
+    """Get OpenAI calls and tokens spent per generated affirmation."""
+    return services.generator.usage.stats()
+
+
+@app.get("/prompt-variants")
+async def get_prompt_variants(services: Services = Depends(get_services)):
+    """Get latency, tokens and regeneration rate per prompt variant."""
+    return services.prompts.stats()
+
+
+@app.get("/events")
+async def get_events(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    recipient: Optional[str] = None,
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 100,
+    services: Services = Depends(get_services),
+):
+    """Query generation and send events, newest first.
+
+    ``start`` and ``end`` take ISO dates or datetimes; a bare ``end`` date
+    includes that whole day.
+    """
+    try:
+        start_ts, end_ts = parse_time(start), parse_time(end, end=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await asyncio.to_thread(
+        services.event_log.query,
+        start_ts,
+        end_ts,
+        recipient,
+        status,
+        kind,
+        max(1, min(limit, 1000)),
+    )
+
+
+@app.get("/event-log-status")
+async def get_event_log_status(services: Services = Depends(get_services)):
+    """Get segment counts, queued events and pruning counters of the event log."""
+    return services.event_log.stats()
+
+
+@app.get("/idempotency-status")
+async def get_idempotency_status(services: Services = Depends(get_services)):
+    """Get stored idempotency keys, replayed sends and in-progress conflicts."""
+    return await asyncio.to_thread(services.idempotency.stats)
+
+
+@app.get("/pool-status")
+async def get_pool_status(services: Services = Depends(get_services)):
+    """Get depth, refill rate and hit/miss counters of the affirmation pool."""
+    return services.affirmation_pool.stats()
+
+
+@app.get("/history-status")
+async def get_history_status(services: Services = Depends(get_services)):
+    """Get the size of the sent-affirmation history and duplicates caught."""
+    return services.history.stats()
+
+
+@app.get("/coalescing-status")
+async def get_coalescing_status(services: Services = Depends(get_services)):
+    """Get originated vs. coalesced /get-affirmation generations."""
+    return services.affirmation_flight.stats()
+
+
+@app.get("/router-status")
+async def get_router_status(services: Services = Depends(get_services)):
+    """Get per-provider wins, failures and hedge deadlines."""
+    return {
+        "get_affirmation": services.affirmation_router.stats(),
+        "send_email": services.email_router.stats(),
+        "scheduled": services.scheduler.router.stats(),
+    }
+
+
 @app.post("/test-email")
-async def test_email_connection():
+async def test_email_connection(services: Services = Depends(get_services)):
     """Test the email configuration and send a test email."""
     try:
         # Test connection
-        connection_ok = email_service.test_email_connection()
+        connection_ok = await asyncio.to_thread(
+            services.email_service.test_email_connection
+        )
         if not connection_ok:
             raise HTTPException(status_code=500, detail="Email connection test failed")
 
         # Send test email
-        scheduler.test_email_now()
+        await services.scheduler.test_email_now_async()
         return {"message": "Test email sent successfully"}
     except Exception as e:
         logger.error(f"Error testing email: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to test email")
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Start the scheduler when the application starts."""
-    try:
-        # Check if email is configured
-        if all(
-            [
-                os.getenv("SENDER_EMAIL"),
-                os.getenv("SENDER_PASSWORD"),
-                os.getenv("RECIPIENT_EMAIL"),
-            ]
-        ):
-            # Start scheduler with default time (9:00 AM)
-            scheduler.start_scheduler()
-            logger.info("Application started with daily email scheduler enabled")
-        else:
-            logger.warning(
-                "Email not configured. Scheduler will not start automatically."
-            )
-    except Exception as e:
-        logger.error(f"Error during startup: {str(e)}")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Stop the scheduler when the application shuts down."""
-    try:
-        scheduler.stop_scheduler()
-        logger.info("Application shutdown - scheduler stopped")
-    except Exception as e:
-        logger.error(f"Error during shutdown: {str(e)}")
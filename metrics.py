@@ -0,0 +1,219 @@
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a fast template render to a slow SMTP login
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class for metrics kept in memory and rendered in Prometheus text format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label pairs, value) triples for the exposition output."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "_total", list(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        for key, (counts, total, count) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield "_bucket", pairs + [("le", _format_value(float(bound)))], cumulative
+            yield "_sum", pairs, total
+            yield "_count", pairs, count
+
+
+class Registry:
+    """Collection of metrics served by /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+FAILURES = Counter(
+    "affirmation_failures", "Failures by pipeline stage.", ["stage"]
+)
+OPENAI_TOKENS = Counter(
+    "affirmation_openai_tokens", "OpenAI tokens used, by prompt or completion.", ["kind"]
+)
+OPENAI_LATENCY = Histogram(
+    "affirmation_openai_completion_seconds", "OpenAI chat completion latency."
+)
+PROMPT_VARIANT_LATENCY = Histogram(
+    "affirmation_prompt_variant_seconds",
+    "Single-affirmation OpenAI completion latency by prompt variant.",
+    ["variant"],
+)
+AFFIRMATIONS_DEV_LATENCY = Histogram(
+    "affirmation_affirmations_dev_seconds", "affirmations.dev request latency per attempt."
+)
+SMTP_LATENCY = Histogram(
+    "affirmation_smtp_phase_seconds",
+    "SMTP latency by phase (connect, starttls, login, send).",
+    ["phase"],
+)
+RENDER_LATENCY = Histogram(
+    "affirmation_template_render_seconds", "Email template render time."
+)
+JOB_LAG = Histogram(
+    "affirmation_scheduler_job_lag_seconds",
+    "Delay between a job's scheduled run time and its actual start.",
+    ["job"],
+)
+JOB_DURATION = Histogram(
+    "affirmation_scheduler_job_duration_seconds", "Scheduler job run time.", ["job"]
+)
+
+
+class timed:
+    """Time a block or function into a histogram.
+
+    Works as a context manager and as a decorator for plain and async
+    functions. Exceptions are counted in ``FAILURES`` under ``stage``;
+    cancellations are neither timed nor counted.
+    """
+
+    __slots__ = ("histogram", "stage", "labels", "_start")
+
+    def __init__(self, histogram: Histogram, stage: Optional[str] = None, **labels):
+        self.histogram = histogram
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not issubclass(exc_type, Exception):
+            return False
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+        if exc_type is not None and self.stage:
+            FAILURES.inc(stage=self.stage)
+        return False
+
+    def _copy(self):
+        return timed(self.histogram, self.stage, **self.labels)
+
+    def __call__(self, fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with self._copy():
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self._copy():
+                return fn(*args, **kwargs)
+
+        return wrapper
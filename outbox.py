@@ -0,0 +1,419 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+# Attempts at recording a delivery outcome before giving up (about 10 s)
+STATE_RETRIES = 10
+
+
+class OutboxBackend(ABC):
+    """Storage for queued outbound messages."""
+
+    @abstractmethod
+    def enqueue_many(self, kind: str, payloads: List[dict]) -> List[int]:
+        """Store new messages as pending and return their ids."""
+
+    @abstractmethod
+    def claim(self) -> Optional[dict]:
+        """Atomically mark the next due pending message as sending and return it."""
+
+    @abstractmethod
+    def mark_sent(self, message_id: int, attempts: int) -> bool:
+        """Record a successful delivery of the claim made on attempt ``attempts``.
+
+        Returns ``False`` if that claim is no longer current, e.g. because the
+        message was requeued as stale and claimed again.
+        """
+
+    @abstractmethod
+    def mark_failed(
+        self, message_id: int, attempts: int, error: str, retry_at: Optional[float]
+    ) -> bool:
+        """Reschedule the message at ``retry_at``, or dead-letter it if ``None``.
+
+        Like ``mark_sent``, only applies to the current claim.
+        """
+
+    @abstractmethod
+    def get(self, message_id: int) -> Optional[dict]:
+        """Current state of a message."""
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Number of messages in each status."""
+
+    @abstractmethod
+    def next_due(self) -> Optional[float]:
+        """When the earliest pending message becomes due."""
+
+    def close(self):
+        pass
+
+
+class SQLiteOutboxBackend(OutboxBackend):
+    """Outbox persisted in a SQLite table, safe across restarts."""
+
+    def __init__(self, path: Optional[str] = None, sending_timeout: Optional[float] = None):
+        self.path = path or os.getenv("OUTBOX_DB", "outbox.db")
+        # A message still "sending" after this long belongs to a dead process
+        self.sending_timeout = sending_timeout or float(
+            os.getenv("OUTBOX_SENDING_TIMEOUT", "300")
+        )
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)"
+        )
+
+    def enqueue_many(self, kind: str, payloads: List[dict]) -> List[int]:
+        now = time.time()
+        ids = []
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for payload in payloads:
+                    cursor = self.conn.execute(
+                        "INSERT INTO outbox (kind, payload, status, next_attempt_at, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (kind, json.dumps(payload), PENDING, now, now, now),
+                    )
+                    ids.append(cursor.lastrowid)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def claim(self) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Messages a dead process was sending go back in the queue. Other
+                # live workers may share this database, so only stale ones.
+                recovered = self.conn.execute(
+                    "UPDATE outbox SET status = ? WHERE status = ? AND updated_at < ?",
+                    (PENDING, SENDING, now - self.sending_timeout),
+                ).rowcount
+                if recovered:
+                    logger.info(f"Requeued {recovered} interrupted outbox messages")
+
+                row = self.conn.execute(
+                    "SELECT id, kind, payload, attempts FROM outbox "
+                    "WHERE status = ? AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT 1",
+                    (PENDING, now),
+                ).fetchone()
+                if row:
+                    self.conn.execute(
+                        "UPDATE outbox SET status = ?, attempts = attempts + 1, updated_at = ? "
+                        "WHERE id = ?",
+                        (SENDING, now, row[0]),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        if not row:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "payload": json.loads(row[2]),
+            "attempts": row[3] + 1,
+        }
+
+    def mark_sent(self, message_id: int, attempts: int) -> bool:
+        with self._lock:
+            return self.conn.execute(
+                "UPDATE outbox SET status = ?, last_error = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (SENT, time.time(), message_id, SENDING, attempts),
+            ).rowcount == 1
+
+    def mark_failed(
+        self, message_id: int, attempts: int, error: str, retry_at: Optional[float]
+    ) -> bool:
+        with self._lock:
+            if retry_at is None:
+                cursor = self.conn.execute(
+                    "UPDATE outbox SET status = ?, last_error = ?, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND attempts = ?",
+                    (DEAD, error, time.time(), message_id, SENDING, attempts),
+                )
+            else:
+                cursor = self.conn.execute(
+                    "UPDATE outbox SET status = ?, last_error = ?, next_attempt_at = ?, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND attempts = ?",
+                    (PENDING, error, retry_at, time.time(), message_id, SENDING, attempts),
+                )
+            return cursor.rowcount == 1
+
+    def get(self, message_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, kind, payload, status, attempts, next_attempt_at, last_error, "
+                "created_at, updated_at FROM outbox WHERE id = ?",
+                (message_id,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "payload": json.loads(row[2]),
+            "status": row[3],
+            "attempts": row[4],
+            "next_attempt_at": row[5] if row[3] == PENDING else None,
+            "last_error": row[6],
+            "created_at": row[7],
+            "updated_at": row[8],
+        }
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+            ).fetchall()
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?", (PENDING,)
+            ).fetchone()
+        return row[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class Outbox:
+    """Durable outbound queue drained by a pool of worker threads.
+
+    Handlers are registered per message kind and raise on failure. Failed
+    messages are retried with jittered exponential backoff; after
+    ``max_attempts`` they are moved to the dead-letter state.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[OutboxBackend] = None,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_base: Optional[float] = None,
+        retry_cap: Optional[float] = None,
+    ):
+        self.backend = backend or SQLiteOutboxBackend()
+        self.workers = workers or int(os.getenv("OUTBOX_WORKERS", "4"))
+        self.max_attempts = max_attempts or int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+        self.retry_base = retry_base or float(os.getenv("OUTBOX_RETRY_BASE", "30"))
+        self.retry_cap = retry_cap or float(os.getenv("OUTBOX_RETRY_CAP", "3600"))
+
+        self.handlers: Dict[str, Callable[[dict], None]] = {}
+        self.on_change: Optional[Callable[[], None]] = None
+        # Called with (message, "sent" | "retry" | "dead", error, seconds spent)
+        self.on_result: Optional[Callable[[dict, str, Optional[str], float], None]] = None
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+
+    def register(self, kind: str, handler: Callable[[dict], None]):
+        """Deliver messages of ``kind`` with ``handler(payload)``."""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: dict) -> int:
+        """Queue one message and return its id."""
+        return self.enqueue_many(kind, [payload])[0]
+
+    def enqueue_many(self, kind: str, payloads: List[dict]) -> List[int]:
+        """Queue several messages in one transaction and wake the workers."""
+        ids = self.backend.enqueue_many(kind, payloads)
+        with self._wakeup:
+            self._wakeup.notify_all()
+        self._notify_change()
+        return ids
+
+    def retry_delay(self, attempts: int) -> float:
+        """Jittered exponential backoff before the next attempt."""
+        delay = min(self.retry_cap, self.retry_base * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _notify_change(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception as e:
+                logger.error(f"Error notifying outbox change: {str(e)}")
+
+    def _report(self, message: dict, status: str, error: Optional[str], elapsed: float):
+        if self.on_result:
+            try:
+                self.on_result(message, status, error, elapsed)
+            except Exception as e:
+                logger.error(f"Error reporting outbox result: {str(e)}")
+
+    def _transition(self, mark: Callable[..., bool], *args) -> bool:
+        """Record a delivery outcome, retrying transient errors like "database is locked".
+
+        Dropping the update after a successful send would leave the message
+        "sending", and it would be sent again after ``sending_timeout``.
+        """
+        delay = 0.05
+        for attempt in range(1, STATE_RETRIES + 1):
+            try:
+                return mark(*args)
+            except Exception as e:
+                if attempt == STATE_RETRIES:
+                    logger.error(f"Failed to record outbox message {args[0]} outcome: {str(e)}")
+                    raise
+                logger.warning(f"Retrying outbox message {args[0]} status update: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+    def _process(self, message: dict):
+        started = time.perf_counter()
+        message_id, attempts = message["id"], message["attempts"]
+        try:
+            handler = self.handlers[message["kind"]]
+            handler(message["payload"])
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                logger.error(
+                    f"Outbox message {message_id} dead-lettered after "
+                    f"{attempts} attempts: {str(e)}"
+                )
+                current = self._transition(
+                    self.backend.mark_failed, message_id, attempts, str(e), None
+                )
+                status = "dead"
+            else:
+                delay = self.retry_delay(attempts)
+                logger.warning(
+                    f"Outbox message {message_id} failed ({str(e)}), retrying in {delay:.0f}s"
+                )
+                current = self._transition(
+                    self.backend.mark_failed, message_id, attempts, str(e), time.time() + delay
+                )
+                status = "retry"
+            error = str(e)
+        else:
+            current = self._transition(self.backend.mark_sent, message_id, attempts)
+            status, error = "sent", None
+        if not current:
+            logger.warning(
+                f"Outbox message {message_id} was requeued while attempt {attempts} "
+                f"was in flight; leaving it to the newer claim"
+            )
+        self._report(message, status, error, time.perf_counter() - started)
+        self._notify_change()
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                message = self.backend.claim()
+            except Exception as e:
+                logger.error(f"Error claiming outbox message: {str(e)}")
+                message = None
+
+            if message:
+                try:
+                    self._process(message)
+                except Exception as e:
+                    # Left "sending"; recovered after sending_timeout
+                    logger.error(f"Error processing outbox message {message['id']}: {str(e)}")
+                continue
+
+            # Sleep until new work is enqueued or the next retry is due
+            try:
+                next_due = self.backend.next_due()
+            except Exception as e:
+                logger.error(f"Error reading the outbox schedule: {str(e)}")
+                next_due = None
+            timeout = 5.0 if next_due is None else max(0.05, min(5.0, next_due - time.time()))
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(timeout)
+
+    def start(self):
+        """Start the worker threads."""
+        if self._threads:
+            return
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Outbox started with {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """Stop the workers after their current message.
+
+        Returns whether every worker finished within ``timeout``; those that
+        did not are still tracked and can be waited for again.
+        """
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        return not self._threads
+
+    def get(self, message_id: int) -> Optional[dict]:
+        return self.backend.get(message_id)
+
+    def stats(self) -> dict:
+        return {"workers": len(self._threads), **self.backend.counts()}
+
+    def close(self):
+        """Stop the workers and close the backend once none is mid-delivery.
+
+        A worker still sending after the timeout keeps the backend open, so
+        its delivery is recorded instead of being left "sending" and sent
+        again after ``sending_timeout``.
+        """
+        if self.stop():
+            self.backend.close()
+            return
+        logger.warning(
+            f"{len(self._threads)} outbox workers still delivering; waiting before closing"
+        )
+        while not self.stop(timeout=30.0):
+            logger.warning(f"Still waiting for {len(self._threads)} outbox workers")
+        self.backend.close()
@@ -0,0 +1,214 @@
+"""Chat prompts for affirmation generation, with weighted A/B variants."""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+from generator import TokenUsage
+from metrics import PROMPT_VARIANT_LATENCY
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "You are PB — authentic, sharp, never corny. "
+    "Your affirmations for your girlfriend are deep, original, and well-worded, "
+    "with richer vocabulary and poetic charm. "
+    "Avoid clichés, keep it personal, captivating, and real."
+)
+
+USER_PROMPT = (
+    "Generate one short message for my girlfriend — it can be an affirmation, compliment, reassurance, gratitude, flirty line, or poetic note. "
+    "Make it deep, original, vocabulary-rich, slightly poetic but natural. "
+    "Avoid corny or generic phrasing; it should feel authentic, charming, and real, and saying 'in the quiet tapestry of our lives'."
+)
+
+# Built-in variants; PROMPTS_FILE replaces them and PROMPT_WEIGHTS reweights them
+DEFAULT_VARIANTS = [
+    {"name": "baseline", "system": SYSTEM_PROMPT, "user": USER_PROMPT, "weight": 1},
+    {
+        "name": "concise",
+        "system": "You are PB: sharp, warm, never corny. You write original, personal affirmations for your girlfriend.",
+        "user": (
+            "One short message for her: an affirmation, compliment, reassurance, gratitude, "
+            "flirty line or poetic note. Rich but natural wording, no clichés."
+        ),
+        "weight": 0,
+    },
+]
+
+# Recipient of the affirmation being generated, for sticky variant assignment
+prompt_recipient: ContextVar[Optional[str]] = ContextVar("prompt_recipient", default=None)
+
+
+class FrozenMessage(dict):
+    """A chat message that can be shared by every request but not changed."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Prompt messages are shared and read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def build_messages(system: str, user: str) -> Tuple[FrozenMessage, ...]:
+    return (
+        FrozenMessage(role="system", content=system),
+        FrozenMessage(role="user", content=user),
+    )
+
+
+class PromptVariant:
+    """One prompt template with its prebuilt messages and outcome stats."""
+
+    def __init__(self, name: str, system: str, user: str, weight: float = 1):
+        if weight < 0:
+            raise ValueError(f"Prompt variant {name} has a negative weight")
+        self.name = name
+        self.weight = weight
+        self.messages = build_messages(system, user)
+        # Single completions and pool batches; batches share their prompt tokens
+        self.usage = TokenUsage(counter=None)
+        self.batch_usage = TokenUsage(counter=None)
+        self.failures = 0
+        self.regenerations = 0
+        self._latencies = deque(maxlen=500)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self):
+        """Time one single-affirmation completion; cancellations are not counted."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(elapsed)
+        PROMPT_VARIANT_LATENCY.observe(elapsed, variant=self.name)
+
+    def record_regeneration(self):
+        with self._lock:
+            self.regenerations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            failures = self.failures
+            regenerations = self.regenerations
+        usage = self.usage.stats()
+        affirmations = usage["affirmations"] + self.batch_usage.affirmations
+        return {
+            "weight": self.weight,
+            "completions": len(latencies),
+            "failures": failures,
+            "latency_p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "latency_p95_s": (
+                round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3)
+                if latencies
+                else None
+            ),
+            "tokens": usage,
+            "batch_tokens": self.batch_usage.stats(),
+            "regenerations": regenerations,
+            "regeneration_rate": round(regenerations / affirmations, 3) if affirmations else None,
+        }
+
+
+class PromptRegistry:
+    """Prompt variants loaded once, with weighted and sticky A/B assignment.
+
+    Each variant's messages are built once and shared read-only by every
+    completion. A recipient always gets the same variant for a given set of
+    weights; requests without one draw a variant at random by weight.
+    """
+
+    def __init__(self, path: Optional[str] = None, weights: Optional[str] = None):
+        self.path = path or os.getenv("PROMPTS_FILE")
+        self.variants: Dict[str, PromptVariant] = {}
+        for spec in self._load():
+            variant = PromptVariant(
+                spec["name"], spec["system"], spec["user"], float(spec.get("weight", 1))
+            )
+            self.variants[variant.name] = variant
+        self._apply_weights(weights or os.getenv("PROMPT_WEIGHTS", ""))
+
+        self._active = [v for v in self.variants.values() if v.weight > 0]
+        if not self._active:
+            raise ValueError("At least one prompt variant needs a positive weight")
+        self._cumulative = list(accumulate(v.weight for v in self._active))
+
+        # Recent affirmations and the variant that wrote them, to attribute regenerations
+        self._recent: "OrderedDict[str, PromptVariant]" = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info(
+            "Prompt variants: "
+            + ", ".join(f"{v.name}={v.weight:g}" for v in self.variants.values())
+        )
+
+    def _load(self) -> List[dict]:
+        if not self.path:
+            return DEFAULT_VARIANTS
+        with open(self.path, encoding="utf-8") as f:
+            variants = json.load(f)["variants"]
+        logger.info(f"Loaded {len(variants)} prompt variants from {self.path}")
+        return variants
+
+    def _apply_weights(self, weights: str):
+        # "baseline=3,concise=1"
+        for item in filter(None, (part.strip() for part in weights.split(","))):
+            name, _, weight = item.partition("=")
+            if name.strip() not in self.variants:
+                raise ValueError(f"Unknown prompt variant in PROMPT_WEIGHTS: {name}")
+            variant = self.variants[name.strip()]
+            variant.weight = float(weight)
+            if variant.weight < 0:
+                raise ValueError(f"Prompt variant {variant.name} has a negative weight")
+
+    def choose(self, recipient: Optional[str] = None) -> PromptVariant:
+        """Pick a variant by weight; the same recipient always gets the same one."""
+        if recipient is None:
+            recipient = prompt_recipient.get()
+        if recipient:
+            digest = hashlib.sha256(recipient.strip().lower().encode("utf-8")).digest()
+            point = int.from_bytes(digest[:8], "big") / 2**64
+        else:
+            point = random.random()
+        index = bisect_right(self._cumulative, point * self._cumulative[-1])
+        return self._active[min(index, len(self._active) - 1)]
+
+    def remember(self, variant: PromptVariant, *affirmations: str):
+        """Note which variant wrote these affirmations."""
+        with self._lock:
+            for affirmation in affirmations:
+                self._recent[affirmation] = variant
+                self._recent.move_to_end(affirmation)
+            while len(self._recent) > 1000:
+                self._recent.popitem(last=False)
+
+    def record_regeneration(self, affirmation: str):
+        """Count a near-duplicate that had to be regenerated against its variant."""
+        with self._lock:
+            variant = self._recent.get(affirmation)
+        if variant is not None:
+            variant.record_regeneration()
+
+    def stats(self) -> dict:
+        return {name: variant.stats() for name, variant in self.variants.items()}
+
+
+AFFIRMATION_MESSAGES = build_messages(SYSTEM_PROMPT, USER_PROMPT)
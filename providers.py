@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import List, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import AFFIRMATIONS_DEV_LATENCY, timed
+from resilience import CircuitBreaker, backoff_delays
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AFFIRMATIONS_URL = os.getenv("AFFIRMATIONS_URL", "https://www.affirmations.dev/")
+
+DEFAULT_CORPUS = [
+    "You are loved and appreciated more than words can express 💕",
+    "You make ordinary days feel like something worth remembering.",
+    "Your kindness is quiet, but it changes every room you walk into.",
+    "I carry your laugh with me like a small, warm light.",
+    "You are braver than the doubts that visit you.",
+    "The world is softer and brighter because you are in it.",
+    "Every version of you, even the tired one, is worth cherishing.",
+    "You are my favourite thought on a busy day.",
+]
+
+
+class AffirmationProvider(ABC):
+    """A source of affirmations that can be raced against other sources."""
+
+    name = "provider"
+
+    @abstractmethod
+    async def generate(self) -> str:
+        """Return one affirmation, raising on failure."""
+
+
+class OpenAIProvider(AffirmationProvider):
+    """Chat completions through the shared async generator.
+
+    Each call uses the prompt variant the registry picks for the current
+    recipient and is counted in that variant's stats.
+    """
+
+    name = "openai"
+
+    def __init__(self, generator, prompts):
+        self.generator = generator
+        self.prompts = prompts
+
+    async def generate(self) -> str:
+        variant = self.prompts.choose()
+        with variant.measure():
+            affirmation = await self.generator.generate(variant.messages, usage=variant.usage)
+        self.prompts.remember(variant, affirmation)
+        return affirmation
+
+
+class AffirmationsDevProvider(AffirmationProvider):
+    """affirmations.dev over pooled HTTP clients with retries and a circuit breaker."""
+
+    name = "affirmations.dev"
+
+    def __init__(self, max_connections: int = 4):
+        self.max_connections = max_connections
+        self.timeout = (
+            float(os.getenv("AFFIRMATIONS_CONNECT_TIMEOUT", "3")),
+            float(os.getenv("AFFIRMATIONS_READ_TIMEOUT", "5")),
+        )
+        self.retries = int(os.getenv("AFFIRMATIONS_RETRIES", "2"))
+        self.breaker = CircuitBreaker(
+            "affirmations.dev",
+            failure_threshold=int(os.getenv("AFFIRMATIONS_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("AFFIRMATIONS_BREAKER_RESET", "60")),
+        )
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_connections))
+        self.client = None
+
+    @staticmethod
+    def _parse(payload: dict) -> str:
+        affirmation = payload.get("affirmation", "").strip()
+        if not affirmation:
+            raise ValueError("Empty affirmation in response")
+        return affirmation
+
+    def fetch(self) -> str:
+        """Blocking fetch for thread-based callers."""
+        if not self.breaker.allow():
+            raise RuntimeError("affirmations.dev circuit is open")
+
+        delays = backoff_delays(self.retries)
+        while True:
+            try:
+                with timed(AFFIRMATIONS_DEV_LATENCY, "affirmations_dev"):
+                    response = self.session.get(AFFIRMATIONS_URL, timeout=self.timeout)
+                    response.raise_for_status()
+                    affirmation = self._parse(response.json())
+                self.breaker.record_success()
+                return affirmation
+            except Exception as e:
+                delay = next(delays, None)
+                if delay is None:
+                    self.breaker.record_failure()
+                    raise
+                logger.warning(f"Affirmations API failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    async def generate(self) -> str:
+        if not self.breaker.allow():
+            raise RuntimeError("affirmations.dev circuit is open")
+
+        if self.client is None:
+            connect_timeout, read_timeout = self.timeout
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections),
+            )
+
+        delays = backoff_delays(self.retries)
+        while True:
+            try:
+                with timed(AFFIRMATIONS_DEV_LATENCY, "affirmations_dev"):
+                    response = await self.client.get(AFFIRMATIONS_URL)
+                    response.raise_for_status()
+                    affirmation = self._parse(response.json())
+                self.breaker.record_success()
+                return affirmation
+            except Exception as e:
+                delay = next(delays, None)
+                if delay is None:
+                    self.breaker.record_failure()
+                    raise
+                logger.warning(f"Affirmations API failed ({str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        """Close the HTTP clients."""
+        self.session.close()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class LocalCorpusProvider(AffirmationProvider):
+    """Offline affirmations from AFFIRMATION_CORPUS_FILE or a built-in list."""
+
+    name = "local"
+
+    def __init__(self, corpus: Optional[List[str]] = None):
+        self.corpus = corpus or self.load_corpus()
+
+    @staticmethod
+    def load_corpus() -> List[str]:
+        corpus_file = os.getenv("AFFIRMATION_CORPUS_FILE")
+        if corpus_file:
+            try:
+                with open(corpus_file, encoding="utf-8") as f:
+                    corpus = [line.strip() for line in f if line.strip()]
+                if corpus:
+                    return corpus
+            except OSError as e:
+                logger.error(f"Failed to read affirmation corpus: {str(e)}")
+        return list(DEFAULT_CORPUS)
+
+    async def generate(self) -> str:
+        return random.choice(self.corpus)
+
+
+class HedgedRouter:
+    """Races providers in priority order to cap tail latency.
+
+    The first provider is called immediately. If it has not answered within
+    its deadline (the ``quantile`` of its recent latencies) or it fails, the
+    next provider is fired as well, and so on. The first successful answer
+    wins and the remaining calls are cancelled.
+    """
+
+    def __init__(
+        self,
+        providers: List[AffirmationProvider],
+        quantile: float = 0.95,
+        default_deadline: Optional[float] = None,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.providers = providers
+        self.quantile = quantile
+        self.default_deadline = default_deadline or float(
+            os.getenv("HEDGE_DEFAULT_DEADLINE", "3")
+        )
+        self.min_samples = min_samples
+        self._latencies = {p.name: deque(maxlen=window) for p in providers}
+        self._stats = {
+            p.name: {"calls": 0, "wins": 0, "failures": 0, "cancelled": 0}
+            for p in providers
+        }
+        self.hedged = 0
+
+    def deadline(self, provider: AffirmationProvider) -> float:
+        """How long to wait for ``provider`` before hedging to the next one."""
+        samples = self._latencies[provider.name]
+        if len(samples) < self.min_samples:
+            return self.default_deadline
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    async def _call(self, provider: AffirmationProvider) -> str:
+        stats = self._stats[provider.name]
+        stats["calls"] += 1
+        start = time.perf_counter()
+        try:
+            return await provider.generate()
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            raise
+        except Exception:
+            stats["failures"] += 1
+            raise
+        finally:
+            # Slow losers and failures count too (a cancelled call for at least
+            # as long as it ran); learning only from winners would keep
+            # shrinking the deadline and hedge ever more often
+            self._latencies[provider.name].append(time.perf_counter() - start)
+
+    async def generate(self) -> str:
+        """Return the first successful affirmation from the providers."""
+        loop = asyncio.get_running_loop()
+        pending = {}
+        errors = []
+
+        try:
+            for index, provider in enumerate(self.providers):
+                if index:
+                    self.hedged += 1
+                task = asyncio.create_task(self._call(provider))
+                pending[task] = provider
+
+                is_last = index == len(self.providers) - 1
+                deadline = None if is_last else loop.time() + self.deadline(provider)
+
+                while pending:
+                    timeout = None if deadline is None else max(0, deadline - loop.time())
+                    done, _ = await asyncio.wait(
+                        pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        break  # deadline passed, hedge to the next provider
+
+                    for task in done:
+                        winner = pending.pop(task)
+                        if task.exception() is not None:
+                            errors.append(f"{winner.name}: {task.exception()}")
+                            continue
+                        self._stats[winner.name]["wins"] += 1
+                        return task.result()
+
+                    if not pending:
+                        break  # everything in flight failed, fire the next provider
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise RuntimeError(f"All affirmation providers failed: {'; '.join(errors)}")
+
+    def stats(self) -> dict:
+        """Per-provider calls, wins, failures and current hedge deadline."""
+        return {
+            "hedged": self.hedged,
+            "providers": {
+                p.name: {
+                    **self._stats[p.name],
+                    "deadline_s": round(self.deadline(p), 3),
+                }
+                for p in self.providers
+            },
+        }
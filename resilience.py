@@ -0,0 +1,89 @@
+import logging
+import random
+import threading
+import time
+from typing import Iterator
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def backoff_delays(retries: int, base: float = 0.5, cap: float = 8.0) -> Iterator[float]:
+    """Yield ``retries`` jittered exponential backoff delays ("full jitter")."""
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * 2**attempt))
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream until it has had time to recover.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    ``allow`` returns ``False`` for ``reset_timeout`` seconds. The next call is
+    then let through as a trial (half-open): success closes the breaker,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.total_failures = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call to the upstream should be attempted."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.short_circuited += 1
+                    return False
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit breaker '{self.name}' half-open, trying upstream")
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            if (
+                self.state == self.HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit breaker '{self.name}' opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        """Current state and counters."""
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(
+                    max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1
+                )
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_failures": self.total_failures,
+                "short_circuited": self.short_circuited,
+                "retry_in_s": retry_in,
+            }
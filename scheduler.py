@@ -1,94 +1,755 @@
+import asyncio
 import logging
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import date, datetime
 import os
-import requests
+import threading
+import time
+from zoneinfo import ZoneInfo
+from delivery_index import DEFAULT_BUCKET, DeliveryIndex
+from metrics import FAILURES, JOB_DURATION, JOB_LAG
 from email_service import EmailService
-from openai import OpenAI
-from dotenv import load_dotenv
+from providers import AffirmationsDevProvider, HedgedRouter, LocalCorpusProvider
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+FALLBACK_AFFIRMATION = "You are loved and appreciated more than words can express 💕"
+
+# Job that picks up schedule changes made by other worker processes
+SCHEDULE_SYNC_JOB = "schedule_sync"
+
+
 class AffirmationScheduler:
-    def __init__(self):
-        self.scheduler = BackgroundScheduler()
-        self.email_service = EmailService()
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, email_service=None, affirmations_dev=None):
+        # "background" runs jobs on a thread pool, "asyncio" runs them as
+        # coroutines on the application's event loop
+        self.mode = os.getenv("SCHEDULER_MODE", "background").lower()
+        self.max_concurrency = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "4"))
+        job_defaults = {
+            "misfire_grace_time": int(os.getenv("SCHEDULER_MISFIRE_GRACE", "300")),
+            "coalesce": True,
+        }
+
+        if self.mode == "asyncio":
+            self.scheduler = AsyncIOScheduler(job_defaults=job_defaults)
+        else:
+            self.scheduler = BackgroundScheduler(job_defaults=job_defaults)
+
+        # Shared with the API when passed in, so there is one SMTP pool and one
+        # affirmations.dev session per process
+        self.email_service = email_service or EmailService()
+
+        # affirmations.dev first, hedged to the offline corpus. services.py swaps
+        # in a router that also includes OpenAI.
+        self.affirmations_dev = affirmations_dev or AffirmationsDevProvider(
+            self.max_concurrency
+        )
+        self.router = HedgedRouter([self.affirmations_dev, LocalCorpusProvider()])
+        self.loop = None
+        self.history = None
+        self.last_send = None
+        self.on_change = None
+        self.outbox = None
+        # Called with (source, perf_counter start, affirmation, error) per generation
+        self.on_generated = None
+        # IdempotencyStore that keeps scheduled sends to one per recipient and day
+        self.idempotency = None
+
+        # Recipients are grouped into per-timezone minute buckets, with one
+        # cron job per occupied bucket rather than one per recipient
+        self.delivery_index = self._build_index()
+        self.default_time = (6, 0)
+        self.daily_enabled = False
+        # LeaderElection shared by the worker processes; only the leader runs
+        # the daily jobs. None means this process always runs them.
+        self.leader = None
+        # SQLiteScheduleStore shared by the worker processes. When set, schedule
+        # changes are written there and every process rebuilds its index from
+        # it, so the current and any later leader see changes made elsewhere.
+        self.store = None
+        self.sync_interval = float(os.getenv("SCHEDULE_SYNC_INTERVAL", "5"))
+        self._schedule_version = None
+        self._index_lock = threading.Lock()
+
+        self.job_stats = {}
+        self._submitted_at = {}
+        self.scheduler.add_listener(
+            self._record_job_event,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED,
+        )
+
+    def _build_index(self, overrides=None) -> DeliveryIndex:
+        """Index of the configured recipients with saved ``overrides`` applied.
+
+        ``overrides`` maps a recipient to ``(hour, minute, timezone)``, or to
+        ``None`` if daily emails to them were stopped.
+        """
+        index = DeliveryIndex()
+        slots = {
+            recipient: self.email_service.recipient_schedules.get(
+                recipient, (None, None, None)
+            )
+            for recipient in self.email_service.recipients
+        }
+        slots.update(overrides or {})
+        for recipient, slot in slots.items():
+            if slot is None:
+                continue
+            try:
+                index.set(recipient, *slot)
+            except ValueError as e:
+                logger.error(f"Using default delivery time for {recipient}: {str(e)}")
+                index.set(recipient)
+        return index
+
+    def _record_job_event(self, event):
+        """Track start lag and run time for each job."""
+        stats = self.job_stats.setdefault(
+            event.job_id,
+            {"runs": 0, "failures": 0, "misfires": 0, "last_lag_s": None, "last_duration_s": None},
+        )
+        now = datetime.now().astimezone()
+        # Delivery bucket jobs share one label to keep metric cardinality low
+        job = event.job_id.split("@")[0]
+
+        if event.code == EVENT_JOB_SUBMITTED:
+            self._submitted_at[event.job_id] = now
+            scheduled = event.scheduled_run_times[-1]
+            lag = (now - scheduled).total_seconds()
+            stats["last_lag_s"] = round(lag, 3)
+            JOB_LAG.observe(max(lag, 0.0), job=job)
+        elif event.code == EVENT_JOB_MISSED:
+            stats["misfires"] += 1
+            FAILURES.inc(stage="job_missed")
+        else:
+            submitted = self._submitted_at.pop(event.job_id, None)
+            if submitted:
+                duration = (now - submitted).total_seconds()
+                stats["last_duration_s"] = round(duration, 3)
+                JOB_DURATION.observe(duration, job=job)
+            stats["runs"] += 1
+            if event.code == EVENT_JOB_ERROR:
+                stats["failures"] += 1
+                FAILURES.inc(stage="job")
+            # The sync job notifies by itself, and only when something changed
+            if event.job_id != SCHEDULE_SYNC_JOB:
+                self._notify_change()
+
+    def _notify_change(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception as e:
+                logger.error(f"Error notifying status change: {str(e)}")
+
+    def _generated(self, started: float, affirmation=None, error=None):
+        if self.on_generated:
+            try:
+                self.on_generated("scheduler", started, affirmation, error)
+            except Exception as e:
+                logger.error(f"Error recording generation: {str(e)}")
 
     def generate_affirmation(self) -> str:
         """Generate a daily affirmation using the Affirmations API."""
+        started = time.perf_counter()
         try:
-            response = requests.get("https://www.affirmations.dev/")
-            return response.json().get("affirmation", "").strip()
+            if self.loop is not None and self.loop.is_running():
+                # Route through the shared async providers on the app's loop
+                future = asyncio.run_coroutine_threadsafe(
+                    self.router.generate(), self.loop
+                )
+                affirmation = future.result()
+            else:
+                affirmation = self.affirmations_dev.fetch()
         except Exception as e:
             logger.error(f"Failed to generate affirmation: {str(e)}")
-            return "You are loved and appreciated more than words can express 💕"
+            self._generated(started, error=str(e))
+            return FALLBACK_AFFIRMATION
+        self._generated(started, affirmation)
+        return affirmation
+
+    async def generate_affirmation_async(self) -> str:
+        """Generate a daily affirmation without blocking the event loop."""
+        started = time.perf_counter()
+        try:
+            affirmation = await self.router.generate()
+        except Exception as e:
+            logger.error(f"Failed to generate affirmation: {str(e)}")
+            self._generated(started, error=str(e))
+            return FALLBACK_AFFIRMATION
+        self._generated(started, affirmation)
+        return affirmation
+
+    def daily_key(self, bucket=DEFAULT_BUCKET) -> str:
+        """Idempotency key of today's send to a bucket; each recipient is appended to it.
 
-    def send_daily_affirmation(self):
-        """Generate and send the daily affirmation email."""
+        "Today" is the date in the bucket's timezone, where the job fires, so
+        buckets far from the server's timezone neither share nor skip a day.
+        """
+        if bucket == DEFAULT_BUCKET:
+            timezone = self.delivery_index.default_timezone
+        else:
+            timezone = bucket[0]
+        today = datetime.now(ZoneInfo(timezone)).date() if timezone else date.today()
+        return f"daily:{today.isoformat()}"
+
+    def _reserve(self, recipients, idempotency_key):
+        """Recipients not yet sent to under ``idempotency_key``, mapped to their keys."""
+        if recipients is None:
+            recipients = self.email_service.recipients
+        if not idempotency_key or not self.idempotency:
+            return {recipient: None for recipient in recipients}
+        keys = {f"{idempotency_key}:{recipient}": recipient for recipient in recipients}
+        reserved = self.idempotency.begin_many(keys)
+        if len(reserved) < len(keys):
+            logger.info(
+                f"Skipping {len(keys) - len(reserved)} recipients already sent {idempotency_key}"
+            )
+        return {keys[key]: key for key in reserved}
+
+    def _settle(self, pending, results):
+        """Keep the keys of recipients that were sent to and free the rest for a retry."""
+        if not self.idempotency:
+            return
+        done = {
+            key: {"result": results[recipient]}
+            for recipient, key in pending.items()
+            if key and results.get(recipient)
+        }
+        failed = [key for recipient, key in pending.items() if key and not results.get(recipient)]
+        if done:
+            self.idempotency.complete_many(done)
+        if failed:
+            self.idempotency.release(*failed)
+
+    def send_daily_affirmation(self, recipients=None, idempotency_key=None):
+        """Generate and send the daily affirmation email.
+
+        With ``idempotency_key``, recipients already sent to under that key
+        are skipped, and nothing is generated if that is all of them.
+        """
+        pending = {}
         try:
             logger.info("Starting daily affirmation email process...")
+            pending = self._reserve(recipients, idempotency_key)
+            if not pending:
+                logger.info("Daily affirmation already sent to every recipient")
+                return {}
 
             # Generate affirmation
-            affirmation = self.generate_affirmation()
+            if self.history:
+                affirmation = self.history.unique_affirmation(self.generate_affirmation)
+            else:
+                affirmation = self.generate_affirmation()
             logger.info(f"Generated affirmation: {affirmation}")
 
-            # Send email
-            success = self.email_service.send_affirmation_email(affirmation)
+            # Queue or send email to every subscriber
+            if self.outbox:
+                results = self._enqueue(affirmation, list(pending))
+            else:
+                results = self.email_service.send_bulk(affirmation, list(pending))
+                self._log_results(results)
+            self._settle(pending, results)
+            if self.history and any(results.values()):
+                self.history.record(affirmation)
+            return results
+
+        except Exception as e:
+            logger.error(f"Error in daily affirmation process: {str(e)}")
+            FAILURES.inc(stage="daily_send")
+            self._settle(pending, {})
+
+    async def send_daily_affirmation_async(self, recipients=None, idempotency_key=None):
+        """Generate and send the daily affirmation email as a coroutine."""
+        pending = {}
+        try:
+            logger.info("Starting daily affirmation email process...")
+            pending = await asyncio.to_thread(self._reserve, recipients, idempotency_key)
+            if not pending:
+                logger.info("Daily affirmation already sent to every recipient")
+                return {}
 
-            if success:
-                logger.info("Daily affirmation email sent successfully!")
+            # Generate affirmation
+            if self.history:
+                affirmation = await self.history.unique_affirmation_async(
+                    self.generate_affirmation_async
+                )
+            else:
+                affirmation = await self.generate_affirmation_async()
+            logger.info(f"Generated affirmation: {affirmation}")
+
+            # Queue or send email to every subscriber
+            if self.outbox:
+                results = await asyncio.to_thread(self._enqueue, affirmation, list(pending))
             else:
-                logger.error("Failed to send daily affirmation email")
+                results = await self.email_service.send_bulk_async(
+                    affirmation, list(pending), max_concurrency=self.max_concurrency
+                )
+                self._log_results(results)
+            await asyncio.to_thread(self._settle, pending, results)
+            if self.history and any(results.values()):
+                await asyncio.to_thread(self.history.record, affirmation)
+            return results
 
         except Exception as e:
             logger.error(f"Error in daily affirmation process: {str(e)}")
+            FAILURES.inc(stage="daily_send")
+            await asyncio.to_thread(self._settle, pending, {})
+
+    def _enqueue(self, affirmation: str, recipients=None):
+        """Queue one email per subscriber in the outbox; returns their message ids."""
+        if recipients is None:
+            recipients = self.email_service.recipients
+        ids = self.outbox.enqueue_many(
+            "email",
+            [{"affirmation": affirmation, "recipient": r} for r in recipients],
+        )
+        logger.info(f"Queued daily affirmation email for {len(ids)} recipients")
+
+        self.last_send = {
+            "at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "queued": len(ids),
+        }
+        self._notify_change()
+        return dict(zip(recipients, ids))
+
+    def _log_results(self, results):
+        failed = [recipient for recipient, ok in results.items() if not ok]
+
+        if not failed:
+            logger.info(
+                f"Daily affirmation email sent successfully to {len(results)} recipients!"
+            )
+        else:
+            logger.error(
+                f"Failed to send daily affirmation email to {len(failed)}/{len(results)} recipients"
+            )
+        self.record_send_result(results)
+
+    def record_send_result(self, results):
+        """Remember the outcome of the latest send for status reporting."""
+        delivered = sum(1 for ok in results.values() if ok)
+        self.last_send = {
+            "at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "delivered": delivered,
+            "failed": len(results) - delivered,
+        }
+        self._notify_change()
 
     def start_scheduler(self, hour: int = 6, minute: int = 0):
         """Start the daily email scheduler."""
         try:
-            # Add the daily job
+            if self.store is not None:
+                self.store.set_daily(True, hour, minute)
+                self.sync_schedule()
+            else:
+                with self._index_lock:
+                    self.default_time = (hour, minute)
+                    self.daily_enabled = True
+                    if self._owns_daily_jobs():
+                        for bucket in self.delivery_index.buckets():
+                            self._add_bucket_job(bucket)
+
+            # Start the scheduler
+            self._start()
+            logger.info(
+                f"Daily affirmation scheduler started. Emails will be sent at {hour:02d}:{minute:02d} daily."
+            )
+            if not self._owns_daily_jobs():
+                logger.info("Another process holds scheduler leadership; daily jobs will run there.")
+            self._notify_change()
+
+        except Exception as e:
+            logger.error(f"Failed to start scheduler: {str(e)}")
+
+    def resume_scheduler(self, hour: int = 6, minute: int = 0):
+        """Start with the shared schedule settings, or at ``hour:minute`` if none were saved.
+
+        A restarted worker keeps the time set through /start-scheduler, and
+        stays stopped after /stop-scheduler, instead of resetting both.
+        """
+        if self.store is None or self.store.load()["enabled"] is None:
+            self.start_scheduler(hour, minute)
+            return
+        self.sync_schedule(force=True)
+        self._start()
+        self._notify_change()
+
+    def sync_schedule(self, force: bool = False) -> bool:
+        """Bring the delivery index and daily jobs up to date with the shared store.
+
+        Cheap when nothing changed: only the store's version is read. Otherwise
+        the changes since this process's version are applied one by one, each
+        touching at most two buckets; the whole index is only rebuilt when
+        ``force`` is set or the store's change log no longer reaches back far
+        enough. Returns whether anything was applied.
+        """
+        if self.store is None:
+            return False
+        if not force and self._schedule_version is not None:
+            if self.store.version() == self._schedule_version:
+                return False
+            changes = self.store.changes(self._schedule_version)
+            if changes is not None:
+                with self._index_lock:
+                    for change in changes:
+                        self._apply_change(change)
+                self._notify_change()
+                return True
+        self._reload_schedule()
+        return True
+
+    def _apply_change(self, change: dict):
+        """Apply one change from the store's log (with the index lock held)."""
+        owned = self._owns_daily_jobs()
+        if "recipient" in change:
+            recipient, slot = change["recipient"], change["slot"]
+            if slot is None:
+                _, closed = self.delivery_index.remove(recipient)
+                opened = None
+            else:
+                try:
+                    opened, closed = self.delivery_index.set(recipient, *slot)
+                except ValueError as e:
+                    logger.error(f"Using default delivery time for {recipient}: {str(e)}")
+                    opened, closed = self.delivery_index.set(recipient)
+            if owned:
+                if closed is not None:
+                    self._remove_bucket_job(closed)
+                if opened is not None:
+                    self._add_bucket_job(opened)
+        else:
+            moved_default = self.default_time != change["default_time"]
+            self.daily_enabled = bool(change["enabled"])
+            self.default_time = change["default_time"]
+            owns = self._owns_daily_jobs()
+            if owns != owned:
+                for bucket in self.delivery_index.buckets():
+                    if owns:
+                        self._add_bucket_job(bucket)
+                    else:
+                        self._remove_bucket_job(bucket)
+            elif owns and moved_default and self.delivery_index.recipients(DEFAULT_BUCKET):
+                self._add_bucket_job(DEFAULT_BUCKET)
+        self._schedule_version = change["version"]
+
+    def _reload_schedule(self):
+        """Rebuild the delivery index and daily jobs from the store's full state."""
+        state = self.store.load()
+        index = self._build_index(state["recipients"])
+
+        with self._index_lock:
+            previous = set(self.delivery_index.buckets())
+            moved_default = self.default_time != state["default_time"]
+            self.delivery_index = index
+            self.daily_enabled = bool(state["enabled"])
+            self.default_time = state["default_time"]
+            self._schedule_version = state["version"]
+
+            buckets = index.buckets()
+            for bucket in previous.difference(buckets):
+                self._remove_bucket_job(bucket)
+            owns = self._owns_daily_jobs()
+            for bucket in buckets:
+                if not owns:
+                    self._remove_bucket_job(bucket)
+                elif (
+                    bucket not in previous
+                    or (bucket == DEFAULT_BUCKET and moved_default)
+                    or self.scheduler.get_job(self.bucket_job_id(bucket)) is None
+                ):
+                    self._add_bucket_job(bucket)
+        self._notify_change()
+
+    async def sync_schedule_async(self):
+        """Sync the schedule from the event loop without blocking it on SQLite."""
+        await asyncio.to_thread(self.sync_schedule)
+
+    def trigger_schedule_sync(self):
+        """Reload the shared schedule as soon as possible."""
+        self._schedule_version = None
+        try:
+            self.scheduler.modify_job(SCHEDULE_SYNC_JOB, next_run_time=datetime.now())
+        except JobLookupError:
+            # Scheduler not started yet; sync right away instead
+            self.sync_schedule()
+
+    @staticmethod
+    def bucket_job_id(bucket) -> str:
+        if bucket == DEFAULT_BUCKET:
+            return "daily_affirmation"
+        return f"daily_affirmation@{DeliveryIndex.label(bucket)}"
+
+    def _add_bucket_job(self, bucket):
+        """Schedule the send job for one delivery bucket."""
+        if bucket == DEFAULT_BUCKET:
+            hour, minute = self.default_time
+            timezone = self.delivery_index.default_timezone
+        else:
+            timezone, hour, minute = bucket
+
+        if self.mode == "asyncio":
+            job = self.send_bucket_async
+        else:
+            job = self.send_bucket
+
+        self.scheduler.add_job(
+            func=job,
+            trigger=CronTrigger(hour=hour, minute=minute, timezone=timezone),
+            args=[bucket],
+            id=self.bucket_job_id(bucket),
+            name=f"Send Daily Affirmation Email ({DeliveryIndex.label(bucket)})",
+            replace_existing=True,
+        )
+
+    def _remove_bucket_job(self, bucket):
+        try:
+            self.scheduler.remove_job(self.bucket_job_id(bucket))
+        except JobLookupError:
+            pass
+
+    def _owns_daily_jobs(self) -> bool:
+        return self.daily_enabled and (self.leader is None or self.leader.is_leader)
+
+    def _fenced(self) -> bool:
+        """Whether leadership lapsed since the job was scheduled."""
+        if self.leader is not None and not self.leader.holds_lease():
+            logger.warning("Skipping daily send: scheduler lease is no longer held")
+            return True
+        return False
+
+    def set_leader(self, is_leader: bool):
+        """Add or drop the daily jobs when this process gains or loses leadership."""
+        if is_leader and self.store is not None:
+            # Another worker may have changed the schedule while this one
+            # followed; the sync adds the jobs from the current shared state
+            self.trigger_schedule_sync()
+            return
+        with self._index_lock:
+            for bucket in self.delivery_index.buckets():
+                if is_leader and self.daily_enabled:
+                    self._add_bucket_job(bucket)
+                else:
+                    self._remove_bucket_job(bucket)
+        self._notify_change()
+
+    def send_bucket(self, bucket):
+        """Send the daily affirmation to the recipients due in one bucket."""
+        if self._fenced():
+            return
+        recipients = self.delivery_index.recipients(bucket)
+        if recipients:
+            # A misfire re-run or a second worker never emails anyone twice a day
+            return self.send_daily_affirmation(recipients, self.daily_key(bucket))
+
+    async def send_bucket_async(self, bucket):
+        """Send the daily affirmation to one bucket from the event loop."""
+        if self._fenced():
+            return
+        recipients = self.delivery_index.recipients(bucket)
+        if recipients:
+            return await self.send_daily_affirmation_async(recipients, self.daily_key(bucket))
+
+    def schedule_recipient(
+        self,
+        recipient: str,
+        hour: int = None,
+        minute: int = None,
+        timezone: str = None,
+    ):
+        """Add or move a recipient to a delivery time; no time means the default.
+
+        Raises ValueError for an invalid time or timezone.
+        """
+        if self.store is not None:
+            self.delivery_index.bucket_for(hour, minute, timezone)
+            self.store.set_recipient(recipient, hour, minute, timezone)
+            self.sync_schedule()
+            return self.delivery_index.slot(recipient)
+
+        with self._index_lock:
+            opened, closed = self.delivery_index.set(recipient, hour, minute, timezone)
+            if self._owns_daily_jobs():
+                if closed is not None:
+                    self._remove_bucket_job(closed)
+                if opened is not None:
+                    self._add_bucket_job(opened)
+        self._notify_change()
+        return self.delivery_index.slot(recipient)
+
+    def unschedule_recipient(self, recipient: str) -> bool:
+        """Stop daily emails to a recipient."""
+        if self.store is not None:
+            self.sync_schedule()
+            if self.delivery_index.slot(recipient) is None:
+                return False
+            self.store.remove_recipient(recipient)
+            self.sync_schedule()
+            return True
+
+        with self._index_lock:
+            found, closed = self.delivery_index.remove(recipient)
+            if closed is not None and self._owns_daily_jobs():
+                self._remove_bucket_job(closed)
+        if found:
+            self._notify_change()
+        return found
+
+    def bucket_status(self):
+        """Occupied delivery buckets with their size and next run time."""
+        buckets = []
+        for bucket in self.delivery_index.buckets():
+            job = self.scheduler.get_job(self.bucket_job_id(bucket))
+            next_run = job.next_run_time if job else None
+            buckets.append(
+                {
+                    "bucket": DeliveryIndex.label(bucket),
+                    "recipients": len(self.delivery_index.recipients(bucket)),
+                    "next_run_time": next_run.isoformat() if next_run else None,
+                }
+            )
+        return {"recipients": len(self.delivery_index), "buckets": buckets}
+
+    def _start(self):
+        """Start the scheduler if needed, remembering the app's event loop."""
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+
+        if self.store is not None and self.scheduler.get_job(SCHEDULE_SYNC_JOB) is None:
             self.scheduler.add_job(
-                func=self.send_daily_affirmation,
-                trigger=CronTrigger(hour=hour, minute=minute),
-                id="daily_affirmation",
-                name="Send Daily Affirmation Email",
+                func=self.sync_schedule_async if self.mode == "asyncio" else self.sync_schedule,
+                trigger=IntervalTrigger(seconds=self.sync_interval),
+                id=SCHEDULE_SYNC_JOB,
+                name="Sync Shared Schedule",
                 replace_existing=True,
+                max_instances=1,
+                coalesce=True,
             )
 
-            # Start the scheduler
+        if not self.scheduler.running:
             self.scheduler.start()
+
+    def stop_daily_job(self):
+        """Remove the daily email jobs, leaving background jobs running."""
+        if self.store is not None:
+            self.store.set_daily(False)
+            self.sync_schedule()
+            logger.info("Daily affirmation job stopped.")
+            return
+
+        with self._index_lock:
+            if not self.daily_enabled:
+                logger.info("Daily affirmation job was not scheduled.")
+                return
+            self.daily_enabled = False
+            for bucket in self.delivery_index.buckets():
+                self._remove_bucket_job(bucket)
+        logger.info("Daily affirmation job stopped.")
+        self._notify_change()
+
+    def start_pool_refill(self, pool, interval_seconds: int = 30):
+        """Keep an AffirmationPool topped up from a background interval job."""
+        try:
+            self.scheduler.add_job(
+                func=pool.refill,
+                trigger=IntervalTrigger(seconds=interval_seconds),
+                id="pool_refill",
+                name="Refill Affirmation Pool",
+                replace_existing=True,
+                next_run_time=datetime.now(),
+                max_instances=1,
+                coalesce=True,
+            )
+            pool.on_low_water = self.trigger_pool_refill
+
+            self._start()
             logger.info(
-                f"Daily affirmation scheduler started. Emails will be sent at {hour:02d}:{minute:02d} daily."
+                f"Affirmation pool refill scheduled every {interval_seconds} seconds."
             )
 
         except Exception as e:
-            logger.error(f"Failed to start scheduler: {str(e)}")
+            logger.error(f"Failed to start pool refill: {str(e)}")
+
+    def trigger_pool_refill(self):
+        """Run the pool refill job as soon as possible."""
+        try:
+            self.scheduler.modify_job("pool_refill", next_run_time=datetime.now())
+        except JobLookupError:
+            pass
+
+    def is_running(self) -> bool:
+        """Whether the daily email job is scheduled and the scheduler is running."""
+        return self.scheduler.running and self.get_next_run_time() is not None
 
     def stop_scheduler(self):
         """Stop the scheduler."""
         try:
             self.scheduler.shutdown()
+            self.email_service.close()
             logger.info("Scheduler stopped.")
         except Exception as e:
             logger.error(f"Error stopping scheduler: {str(e)}")
 
+    async def stop_scheduler_async(self):
+        """Stop the scheduler from the event loop.
+
+        Background jobs may be waiting on the loop to run the provider router,
+        so the blocking shutdown must not run on the loop itself.
+        """
+        if self.mode == "asyncio":
+            self.stop_scheduler()
+        else:
+            await asyncio.to_thread(self.stop_scheduler)
+
+    def _test_send(self):
+        """Recipients and idempotency key of a test email.
+
+        Only the primary recipient gets it, never the subscriber list, and its
+        key is unique to the test so it never claims or matches a daily send.
+        """
+        recipient = self.email_service.recipient_email
+        if not recipient:
+            raise RuntimeError("No recipient configured")
+        return [recipient], f"test-email:{time.time_ns()}"
+
     def test_email_now(self):
         """Send a test email immediately."""
         logger.info("Sending test affirmation email...")
-        self.send_daily_affirmation()
+        self.send_daily_affirmation(*self._test_send())
+
+    async def test_email_now_async(self):
+        """Send a test email immediately from the event loop."""
+        logger.info("Sending test affirmation email...")
+        return await self.send_daily_affirmation_async(*self._test_send())
+
+    async def aclose(self):
+        """Close the HTTP clients."""
+        await self.affirmations_dev.aclose()
 
     def get_next_run_time(self):
-        """Get the next scheduled run time."""
+        """Get the next scheduled run time across all delivery buckets."""
         try:
-            job = self.scheduler.get_job("daily_affirmation")
-            if job:
-                return job.next_run_time
-            return None
+            run_times = [
+                job.next_run_time
+                for job in self.scheduler.get_jobs()
+                if job.id.startswith("daily_affirmation") and job.next_run_time
+            ]
+            return min(run_times) if run_times else None
         except Exception as e:
             logger.error(f"Error getting next run time: {str(e)}")
             return None
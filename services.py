@@ -0,0 +1,518 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class shared:
+    """Service built on first access and then shared by every caller.
+
+    The builder imports what it needs, so heavy client libraries are only
+    loaded once a service is actually used. Each service has its own build
+    lock: a caller only waits for the services it actually needs, not for an
+    unrelated build, like the scheduler's, running in the warm-up thread.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+
+    def __get__(self, services, owner=None):
+        if services is None:
+            return self
+        instance = services._instances.get(self.name)
+        if instance is None:
+            with services._build_lock(self.name):
+                instance = services._instances.get(self.name)
+                if instance is None:
+                    instance = services._instances[self.name] = self.build(services)
+        return instance
+
+
+class Services:
+    """The application's long-lived objects, one instance of each.
+
+    Nothing is constructed when ``main`` is imported. The lifespan handler
+    calls ``start`` once the server is accepting requests, and endpoints get
+    the services through FastAPI dependency injection.
+    """
+
+    def __init__(self):
+        self._instances = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self.leader_election_enabled = (
+            os.getenv("LEADER_ELECTION", "true").lower() != "false"
+        )
+
+    def _build_lock(self, name: str) -> threading.RLock:
+        # Builders only depend on each other acyclically, so taking these
+        # locks nested in dependency order cannot deadlock
+        with self._lock:
+            lock = self._build_locks.get(name)
+            if lock is None:
+                lock = self._build_locks[name] = threading.RLock()
+            return lock
+
+    def built(self, name: str) -> bool:
+        """Whether a service has been constructed yet."""
+        return name in self._instances
+
+    @shared
+    def generator(self):
+        from generator import AffirmationGenerator
+
+        return AffirmationGenerator()
+
+    @shared
+    def email_service(self):
+        from email_service import EmailService
+
+        return EmailService()
+
+    @shared
+    def affirmations_dev(self):
+        from providers import AffirmationsDevProvider
+
+        return AffirmationsDevProvider(int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "4")))
+
+    @shared
+    def corpus_provider(self):
+        from providers import LocalCorpusProvider
+
+        return LocalCorpusProvider()
+
+    @shared
+    def prompts(self):
+        """Prompt variants, loaded once; every OpenAI call picks one."""
+        from prompts import PromptRegistry
+
+        return PromptRegistry()
+
+    @shared
+    def affirmation_router(self):
+        """OpenAI first, hedged to affirmations.dev and then the offline corpus."""
+        from providers import HedgedRouter, OpenAIProvider
+
+        return HedgedRouter(
+            [
+                OpenAIProvider(self.generator, self.prompts),
+                self.affirmations_dev,
+                self.corpus_provider,
+            ]
+        )
+
+    @shared
+    def email_router(self):
+        from providers import HedgedRouter, OpenAIProvider
+
+        return HedgedRouter(
+            [
+                OpenAIProvider(self.generator, self.prompts),
+                self.affirmations_dev,
+                self.corpus_provider,
+            ]
+        )
+
+    @shared
+    def scheduler(self):
+        from providers import HedgedRouter, OpenAIProvider
+        from scheduler import AffirmationScheduler
+
+        scheduler = AffirmationScheduler(self.email_service, self.affirmations_dev)
+        # The scheduled send keeps affirmations.dev as its primary source
+        scheduler.router = HedgedRouter(
+            [
+                self.affirmations_dev,
+                OpenAIProvider(self.generator, self.prompts),
+                self.corpus_provider,
+            ]
+        )
+        scheduler.history = self.history
+        scheduler.outbox = self.outbox
+        scheduler.on_generated = self.log_generation
+        scheduler.idempotency = self.idempotency
+        scheduler.on_change = self.status_broadcaster.notify
+        if self.leader_election_enabled:
+            scheduler.leader = self.leader
+            scheduler.store = self.schedule_store
+        return scheduler
+
+    @shared
+    def leader(self):
+        """Lease deciding which worker process runs the daily jobs."""
+        from leadership import LeaderElection, SQLiteLease
+
+        leader = LeaderElection(SQLiteLease("scheduler"))
+        leader.on_elected = lambda: self.scheduler.set_leader(True)
+        leader.on_lost = lambda: self.scheduler.set_leader(False)
+        return leader
+
+    @shared
+    def schedule_store(self):
+        """Daily-send settings and recipient times shared with the other workers."""
+        from leadership import SQLiteScheduleStore
+
+        return SQLiteScheduleStore()
+
+    @shared
+    def affirmation_pool(self):
+        from affirmation_pool import AffirmationPool
+
+        return AffirmationPool(self.generate_pooled_affirmations)
+
+    @shared
+    def history(self):
+        """Sent affirmations, checked for near-duplicates before every email."""
+        from history import AffirmationHistory
+
+        history = AffirmationHistory()
+        history.on_regenerate = self.prompts.record_regeneration
+        return history
+
+    @shared
+    def outbox(self):
+        """Outbound emails, queued durably and delivered by background workers."""
+        from outbox import Outbox
+
+        outbox = Outbox()
+        outbox.register("email", self.deliver_email)
+        outbox.on_change = self.status_broadcaster.notify
+        outbox.on_result = self.log_delivery
+        return outbox
+
+    @shared
+    def idempotency(self):
+        """Idempotency keys of sends, so retries never email anyone twice."""
+        from idempotency import IdempotencyStore
+
+        return IdempotencyStore()
+
+    @shared
+    def send_flight(self):
+        """Concurrent sends with the same idempotency key share one send."""
+        from singleflight import SingleFlight
+
+        return SingleFlight(memoize_daily=False)
+
+    @shared
+    def event_log(self):
+        """Append-only log of generations and sends, queryable through /events."""
+        from event_log import EventLog
+
+        return EventLog()
+
+    @shared
+    def affirmation_flight(self):
+        """Concurrent /get-affirmation calls share one upstream generation."""
+        from singleflight import SingleFlight
+
+        return SingleFlight()
+
+    @shared
+    def daily_affirmation_flight(self):
+        """One /daily-affirmation result per local day, shared by every caller."""
+        from singleflight import SingleFlight
+
+        return SingleFlight(memoize_daily=True)
+
+    @shared
+    def dashboard(self):
+        """Admin dashboard held in memory, pre-compressed, with ETags."""
+        from http_cache import StaticAsset
+
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "admin_dashboard.html")
+        return StaticAsset(path, "text/html; charset=utf-8")
+
+    @shared
+    def status_broadcaster(self):
+        from broadcaster import StatusBroadcaster
+
+        return StatusBroadcaster(self.build_status)
+
+    def generate_pooled_affirmations(self, n: int) -> list:
+        """Generate a batch of affirmations for the pool (runs on a scheduler thread)."""
+        variant = self.prompts.choose()
+        batch = self.generator.generate_batch_sync(
+            variant.messages, n, usage=variant.batch_usage
+        )
+        self.prompts.remember(variant, *batch)
+        return batch
+
+    def log_generation(self, source: str, started: float, affirmation=None, error=None):
+        """Record a generation event with its latency since ``started``."""
+        self.event_log.record(
+            "generation",
+            "failed" if error else "ok",
+            source=source,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            detail=error or affirmation,
+        )
+
+    async def _pooled_or_generated(self, router) -> str:
+        started = time.perf_counter()
+        affirmation = self.affirmation_pool.pop()
+        if affirmation is not None:
+            self.log_generation("pool", started, affirmation)
+            return affirmation
+        try:
+            affirmation = await router.generate()
+        except Exception as e:
+            self.log_generation("router", started, error=str(e))
+            raise
+        self.log_generation("router", started, affirmation)
+        return affirmation
+
+    async def generate_affirmation(self) -> str:
+        """Take a pre-generated affirmation, or generate one for the API."""
+        return await self._pooled_or_generated(self.affirmation_router)
+
+    async def stream_affirmation(self):
+        """Yield ``("delta", text)`` as an affirmation is generated, then ``("done", ...)``.
+
+        OpenAI tokens are forwarded as they arrive. A pooled affirmation, or
+        the router's if the stream fails before its first token, is sent as a
+        single delta. The full text is recorded in the history so emails avoid
+        repeating it and ``/send-email`` can send it by id.
+        """
+        started = time.perf_counter()
+        affirmation = self.affirmation_pool.pop()
+        source = "pool" if affirmation is not None else "router"
+        try:
+            if affirmation is None and os.getenv("OPENAI_API_KEY"):
+                parts = []
+                variant = self.prompts.choose()
+                try:
+                    with variant.measure():
+                        async for delta in self.generator.stream(
+                            variant.messages, usage=variant.usage
+                        ):
+                            parts.append(delta)
+                            yield "delta", delta
+                except Exception as e:
+                    if parts:
+                        raise
+                    logger.warning(f"Streaming failed before the first token: {str(e)}")
+                if parts:
+                    affirmation = "".join(parts).strip()
+                    source = "openai_stream"
+                    self.prompts.remember(variant, affirmation)
+                else:
+                    affirmation = await self.affirmation_router.generate()
+                    yield "delta", affirmation
+            else:
+                if affirmation is None:
+                    affirmation = await self.affirmation_router.generate()
+                yield "delta", affirmation
+        except Exception as e:
+            self.log_generation(source, started, error=str(e))
+            raise
+        self.log_generation(source, started, affirmation)
+
+        row_id = await asyncio.to_thread(self.history.record, affirmation)
+        yield "done", {"affirmation": affirmation, "id": row_id}
+
+    async def generate_email_affirmation(self) -> str:
+        """Take a pre-generated affirmation, or generate one for an email."""
+        return await self._pooled_or_generated(self.email_router)
+
+    async def send_email_once(
+        self, key: str, recipient: str, history_id: Optional[int] = None
+    ) -> dict:
+        """Queue an affirmation email to ``recipient`` unless ``key`` was already used.
+
+        Repeats of a finished key get its original result back, marked
+        ``replayed``, without generating or sending anything. Concurrent
+        repeats in this process share one send; in another worker they raise
+        ``IdempotencyConflict`` until the first one finishes.
+        """
+        from prompts import prompt_recipient
+
+        async def send():
+            # Generation picks this recipient's prompt variant
+            prompt_recipient.set(recipient)
+            result = await asyncio.to_thread(self.idempotency.begin, key)
+            if result is not None:
+                return {**result, "replayed": True}
+            try:
+                if history_id is not None:
+                    affirmation = self.history.get(history_id)
+                else:
+                    # Generate an affirmation that hasn't been sent before
+                    affirmation = await self.history.unique_affirmation_async(
+                        self.generate_email_affirmation
+                    )
+
+                # Hand the email to the outbox workers instead of waiting on SMTP
+                message_id = await asyncio.to_thread(
+                    self.outbox.enqueue,
+                    "email",
+                    {"affirmation": affirmation, "recipient": recipient},
+                )
+                await asyncio.to_thread(self.history.record, affirmation, recipient)
+            except Exception:
+                await asyncio.to_thread(self.idempotency.release, key)
+                raise
+
+            result = {
+                "message": "Email queued for delivery",
+                "id": message_id,
+                "affirmation": affirmation,
+                "idempotency_key": key,
+            }
+            await asyncio.to_thread(self.idempotency.complete, key, result)
+            return result
+
+        return await self.send_flight.do(key, send)
+
+    def deliver_email(self, payload: dict):
+        """Outbox handler for queued affirmation emails."""
+        self.email_service.deliver(payload["affirmation"], payload["recipient"])
+
+    def log_delivery(self, message: dict, status: str, error, elapsed: float):
+        """Record each outbox delivery attempt as a send event."""
+        self.event_log.record(
+            "send",
+            status,
+            recipient=message["payload"].get("recipient"),
+            source=message["kind"],
+            message_id=message["id"],
+            latency_ms=elapsed * 1000,
+            detail=error,
+        )
+
+    def build_status(self) -> dict:
+        """Snapshot of scheduler state shared by /scheduler-status and /ws/status."""
+        scheduler = self.scheduler
+        next_run = scheduler.get_next_run_time()
+        outbox_counts = self.outbox.backend.counts()
+        leader = self.leader.status() if self.leader_election_enabled else None
+        # On a follower the daily jobs are enabled but run in the leader process
+        running = scheduler.is_running() or bool(
+            leader and not leader["is_leader"] and leader["leader"] and scheduler.daily_enabled
+        )
+        return {
+            "scheduler_running": running,
+            "next_run_time": next_run.isoformat() if next_run else None,
+            "mode": scheduler.mode,
+            "jobs": scheduler.job_stats,
+            "affirmations_breaker": self.affirmations_dev.breaker.status(),
+            "last_send": scheduler.last_send,
+            "pool_depth": self.affirmation_pool.depth(),
+            "queue_depth": outbox_counts["pending"] + outbox_counts["sending"],
+            "outbox": outbox_counts,
+            "leader": leader,
+        }
+
+    def _warm_up(self):
+        # Build what the background jobs need, off the event loop, so no
+        # request pays for imports or client setup. Each service is built on
+        # its own so one failure does not keep the rest from starting.
+        for name in (
+            "prompts",
+            # Takes the directory lock and may convert a previous process's
+            # events to Parquet
+            "event_log",
+            "scheduler",
+            "affirmation_pool",
+            "affirmation_router",
+            "email_router",
+            "affirmation_flight",
+            "daily_affirmation_flight",
+        ):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                logger.error(f"Failed to build {name}: {str(e)}")
+        try:
+            self.dashboard.variants
+        except Exception as e:
+            logger.error(f"Failed to load the dashboard: {str(e)}")
+        if os.getenv("OPENAI_API_KEY"):
+            try:
+                # Importing openai and resolving the completions resource
+                # takes ~0.5 s; do it here rather than on the first request
+                self.generator.client.chat.completions
+            except Exception as e:
+                logger.error(f"Failed to build the OpenAI client: {str(e)}")
+
+    @staticmethod
+    async def _step(description: str, action) -> bool:
+        """Run one startup or shutdown step; a failure is logged and skipped."""
+        try:
+            result = action()
+            if asyncio.iscoroutine(result):
+                await result
+            return True
+        except Exception as e:
+            logger.error(f"Failed to {description}: {str(e)}")
+            return False
+
+    def _start_scheduler(self):
+        if self.email_service.is_configured():
+            self.scheduler.resume_scheduler()
+            logger.info("Application started with daily email scheduler enabled")
+        else:
+            logger.warning("Email not configured. Scheduler will not start automatically.")
+
+    async def start(self):
+        """Build the services and start status push, email delivery and scheduled jobs.
+
+        Each background service starts on its own, so one that fails (a bad
+        path, a missing key) does not keep the others, like email delivery,
+        from running.
+        """
+        await asyncio.to_thread(self._warm_up)
+
+        # Push status changes to connected dashboards
+        await self._step("start status push", self.status_broadcaster.start)
+
+        # Write generation and send events in the background
+        # Only if the warm-up built it; building it here would block the loop
+        if self.built("event_log"):
+            await self._step("start the event log", lambda: self.event_log.start())
+
+        # Deliver queued emails in the background
+        if self.built("outbox"):
+            await self._step("start email delivery", lambda: self.outbox.start())
+
+        # Keep the pre-generated affirmation pool topped up
+        if os.getenv("OPENAI_API_KEY"):
+            await self._step(
+                "start pool refill",
+                lambda: self.scheduler.start_pool_refill(
+                    self.affirmation_pool, int(os.getenv("POOL_REFILL_INTERVAL", "30"))
+                ),
+            )
+
+        await self._step("start the scheduler", self._start_scheduler)
+
+        # With several workers, only the lease holder runs the daily jobs
+        if self.leader_election_enabled:
+            await self._step("start leader election", self.leader.start)
+
+    async def stop(self):
+        """Stop background work and close whatever was built."""
+        steps = [
+            ("status_broadcaster", lambda: self.status_broadcaster.stop()),
+            ("leader", lambda: self.leader.stop()),
+            ("scheduler", lambda: self.scheduler.stop_scheduler_async()),
+            ("schedule_store", lambda: self.schedule_store.close()),
+            ("generator", lambda: self.generator.close()),
+            ("affirmations_dev", lambda: self.affirmations_dev.aclose()),
+            ("outbox", lambda: asyncio.to_thread(self.outbox.close)),
+            ("idempotency", lambda: self.idempotency.close()),
+            ("event_log", lambda: asyncio.to_thread(self.event_log.close)),
+            ("email_service", lambda: self.email_service.close()),
+            ("history", lambda: self.history.close()),
+        ]
+        for name, action in steps:
+            if self.built(name):
+                await self._step(f"stop {name}", action)
+        logger.info("Application shutdown - scheduler stopped")
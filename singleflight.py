@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+from datetime import date
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one in-flight upstream call.
+
+    The first caller for a key starts the call as a task; callers that
+    arrive while it is running await the same task instead of starting their
+    own. With ``memoize_daily`` the result is also kept until the end of the
+    local day, so every caller gets "today's" value.
+    """
+
+    def __init__(self, memoize_daily: Optional[bool] = None):
+        if memoize_daily is None:
+            memoize_daily = os.getenv("AFFIRMATION_DAILY_MEMO", "false").lower() == "true"
+        self.memoize_daily = memoize_daily
+
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._memo: Dict[Hashable, Tuple[date, str]] = {}
+
+        self.originated = 0
+        self.coalesced = 0
+        self.memo_hits = 0
+
+    def _memoized(self, key: Hashable) -> Optional[str]:
+        if not self.memoize_daily or key not in self._memo:
+            return None
+        day, value = self._memo[key]
+        if day != date.today():
+            del self._memo[key]
+            return None
+        return value
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None and self.memoize_daily:
+            self._memo[key] = (date.today(), task.result())
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[str]]) -> str:
+        """Return ``fn()``'s result, sharing it with concurrent callers of ``key``."""
+        value = self._memoized(key)
+        if value is not None:
+            self.memo_hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.originated += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+
+        # Shield so one caller disconnecting doesn't cancel the call for everyone
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable):
+        """Drop a memoized value so the next call regenerates it."""
+        self._memo.pop(key, None)
+
+    def stats(self) -> dict:
+        """Originated vs. coalesced calls and memo hits."""
+        served = self.originated + self.coalesced + self.memo_hits
+        return {
+            "memoize_daily": self.memoize_daily,
+            "in_flight": len(self._inflight),
+            "originated": self.originated,
+            "coalesced": self.coalesced,
+            "memo_hits": self.memo_hits,
+            "upstream_saved_ratio": round(1 - self.originated / served, 3) if served else None,
+        }